@@ -1,7 +1,7 @@
-from typing import List
+from typing import ClassVar, List, Set
 from typing import Optional
 from pydantic import BaseModel, Field
-from .nubela_response_models import NubelaResponse, Experience, VolunteeringExperience, Language
+from .nubela_response_models import LazyNubelaResponse, Experience, VolunteeringExperience, Language
 
 
 class ExperiencesWithMetadata(BaseModel):
@@ -40,4 +40,17 @@ class ContactData(BaseModel):
     languages: Optional[List[str]] = None
     volunteer_work: Optional[List[VolunteeringExperience]] = None
     interviews_and_podcasts: List[dict] = Field(default_factory=list)
-    nubela_response: Optional[NubelaResponse] = None
+    nubela_response: Optional[LazyNubelaResponse] = None
+    # Enrichment stages that failed or timed out; such contacts are enriched again the next time they're requested
+    failed_stages: List[str] = Field(default_factory=list)
+
+    # What the review UI renders on a contact card; everything else is served by /contact/<username>
+    CARD_FIELDS: ClassVar[Set[str]] = {
+        'spreadsheet_id', 'row_number', 'colored_cells', 'contact_first_name', 'contact_last_name',
+        'contact_job_title', 'contact_company_name', 'hook_name', 'company', 'contact_profile_link',
+        'linkedin_username', 'relevant_experiences', 'messenger_campaign_instance', 'bio', 'headline', 'industry',
+        'profile_picture', 'banner_picture', 'languages', 'volunteer_work', 'interviews_and_podcasts',
+    }
+
+    def to_card(self) -> dict:
+        return self.model_dump(include=self.CARD_FIELDS)
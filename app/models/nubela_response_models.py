@@ -1,5 +1,7 @@
-from pydantic import BaseModel
-from typing import List, Optional
+import orjson
+from pydantic import BaseModel, GetCoreSchemaHandler, TypeAdapter
+from pydantic_core import CoreSchema, core_schema
+from typing import Any, Dict, List, Optional, Union
 from datetime import datetime, timedelta
 
 from app.models import PqKeywords
@@ -51,12 +53,7 @@ class Experience(BaseModel):
         if not self.title:
             return False
 
-        title_lower = self.title.lower()
-        return (
-                (any(title.lower() in title_lower for title in keywords.titles) or
-                 any(seniority.lower() in title_lower for seniority in keywords.seniority)) and
-                not any(keyword.lower() in title_lower for keyword in keywords.negative_keywords)
-        )
+        return keywords.get_matcher().matches(self.title)
 
     def get_start_date(self) -> Optional[datetime]:
         if self.starts_at and self.starts_at.year:
@@ -263,3 +260,78 @@ class NubelaResponse(BaseModel):
     interests: Optional[List[str]] = None
     personal_emails: Optional[List[str]] = None
     personal_numbers: Optional[List[str]] = None
+
+
+class LazyNubelaResponse:
+    """
+    A Nubela profile that keeps the response as plain JSON data and validates a field into its models only when
+    the field is read, e.g. `profile.experiences`. Large parts of a profile such as `people_also_viewed` or
+    `activities` are never read by the app, so they are never validated.
+
+    Fields are those of `NubelaResponse`; `to_model` validates the whole profile. Inside pydantic models it
+    validates from a dict, JSON bytes or a `NubelaResponse`, and serializes back to a dict of the profile fields.
+    """
+
+    _field_adapters: Dict[str, TypeAdapter] = {}
+
+    def __init__(self, raw: Union[bytes, str, Dict[str, Any]]):
+        self._raw = raw
+        self._data: Optional[Dict[str, Any]] = raw if isinstance(raw, dict) else None
+        self._values: Dict[str, Any] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        field = NubelaResponse.model_fields.get(name) if not name.startswith('_') else None
+        if field is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+        if name not in self._values:
+            value = self._fields().get(name, field.default)
+            self._values[name] = self._field_adapter(name).validate_python(value)
+        return self._values[name]
+
+    def __deepcopy__(self, memo) -> 'LazyNubelaResponse':
+        # A profile is never changed once fetched, so copies of a contact share it
+        return self
+
+    def _fields(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = orjson.loads(self._raw)
+        return self._data
+
+    @classmethod
+    def _field_adapter(cls, name: str) -> TypeAdapter:
+        adapter = cls._field_adapters.get(name)
+        if adapter is None:
+            adapter = cls._field_adapters[name] = TypeAdapter(NubelaResponse.model_fields[name].annotation)
+        return adapter
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = self._fields()
+        return {
+            name: (self._field_adapter(name).dump_python(self._values[name], mode='json') if name in self._values
+                   else data.get(name, field.default))
+            for name, field in NubelaResponse.model_fields.items()
+        }
+
+    def to_model(self) -> NubelaResponse:
+        return NubelaResponse.model_validate(self.to_dict())
+
+    @classmethod
+    def _validate(cls, value: Any) -> 'LazyNubelaResponse':
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, NubelaResponse):
+            return cls(value.model_dump(mode='json'))
+        if isinstance(value, (dict, bytes, str)):
+            return cls(value)
+        raise ValueError(f"Expected a Nubela profile, got {type(value).__name__}")
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: Any, handler: GetCoreSchemaHandler) -> CoreSchema:
+        return core_schema.no_info_plain_validator_function(
+            cls._validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(lambda value: value.to_dict())
+        )
+
+    def __repr__(self):
+        return f"{type(self).__name__}(public_identifier={self.public_identifier!r})"
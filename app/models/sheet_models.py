@@ -1,7 +1,38 @@
+import re
 from os.path import basename
 
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import List, Dict, Any, Optional, Set, Iterable, Pattern
+
+
+class KeywordMatcher:
+    """
+    Matches job titles against a set of pq keywords, with each keyword list compiled into a single regex so a
+    title is scanned once no matter how many keywords there are.
+
+    A title matches if it contains any title or seniority keyword and none of the negative keywords, all
+    compared case-insensitively as substrings.
+    """
+
+    def __init__(self, keywords: 'PqKeywords'):
+        self._positive = self._compile([*keywords.titles, *keywords.seniority])
+        self._negative = self._compile(keywords.negative_keywords)
+
+    @staticmethod
+    def _compile(keywords: Iterable[str]) -> Optional[Pattern]:
+        # Longest first, so overlapping keywords don't shadow each other in the alternation
+        unique_keywords = sorted({keyword.lower() for keyword in keywords}, key=len, reverse=True)
+        if not unique_keywords:
+            return None
+        return re.compile('|'.join(re.escape(keyword) for keyword in unique_keywords))
+
+    def matches(self, title: str) -> bool:
+        if self._positive is None:
+            return False
+
+        title_lower = title.lower()
+        return (self._positive.search(title_lower) is not None and
+                (self._negative is None or self._negative.search(title_lower) is None))
 
 
 class PqKeywords(BaseModel):
@@ -9,6 +40,16 @@ class PqKeywords(BaseModel):
     seniority: List[str] = Field(default_factory=list)
     negative_keywords: List[str] = Field(default_factory=list)
 
+    _matcher: Optional[KeywordMatcher] = PrivateAttr(default=None)
+
+    def get_matcher(self) -> KeywordMatcher:
+        if self._matcher is None:
+            self._matcher = KeywordMatcher(self)
+        return self._matcher
+
+    def set_matcher(self, matcher: KeywordMatcher):
+        self._matcher = matcher
+
 
 class SheetRow(BaseModel):
     row_number: int
@@ -29,17 +70,61 @@ class SheetData(BaseModel):
     rows: List[SheetRow]
     colored_cells: List[str] = Field(default_factory=list)
 
+    # Lazily built lookups into `rows`, by row number and by normalized cell value, holding row positions.
+    # They are kept up to date by `update_row`; rows changed any other way are not reflected.
+    _positions_by_row_number: Optional[Dict[int, int]] = PrivateAttr(default=None)
+    _positions_by_value: Optional[Dict[str, Set[int]]] = PrivateAttr(default=None)
+
     def get_row(self, row_number: int) -> Optional[SheetRow]:
-        return next((row for row in self.rows if row.row_number == row_number), None)
+        position = self._row_number_index().get(row_number)
+        return self.rows[position] if position is not None else None
 
     def get_row_by_text(self, text: str) -> Optional[SheetRow]:
         text_lower = text.lower().strip()
-        return next((row for row in self.rows if text_lower in row.get_lowercase_values()), None)
+        positions = self._value_index().get(text_lower)
+        return self.rows[min(positions)] if positions else None
 
     def update_row(self, row_number: int, new_data: Dict[str, Any]):
-        row = self.get_row(row_number)
-        if row:
-            row.update(new_data)
+        position = self._row_number_index().get(row_number)
+        if position is None:
+            return
+
+        row = self.rows[position]
+        if self._positions_by_value is not None:
+            self._remove_from_value_index(position, row)
+        row.update(new_data)
+        if self._positions_by_value is not None:
+            self._add_to_value_index(self._positions_by_value, position, row)
+
+    def _row_number_index(self) -> Dict[int, int]:
+        if self._positions_by_row_number is None:
+            positions = {}
+            for position, row in enumerate(self.rows):
+                positions.setdefault(row.row_number, position)
+            self._positions_by_row_number = positions
+        return self._positions_by_row_number
+
+    def _value_index(self) -> Dict[str, Set[int]]:
+        if self._positions_by_value is None:
+            # Only a complete index is published, since other threads search the same sheet
+            positions = {}
+            for position, row in enumerate(self.rows):
+                self._add_to_value_index(positions, position, row)
+            self._positions_by_value = positions
+        return self._positions_by_value
+
+    @staticmethod
+    def _add_to_value_index(positions_by_value: Dict[str, Set[int]], position: int, row: SheetRow):
+        for value in row.get_lowercase_values():
+            positions_by_value.setdefault(value, set()).add(position)
+
+    def _remove_from_value_index(self, position: int, row: SheetRow):
+        for value in row.get_lowercase_values():
+            positions = self._positions_by_value.get(value)
+            if positions:
+                positions.discard(position)
+                if not positions:
+                    del self._positions_by_value[value]
 
     @classmethod
     def from_list(cls, data: List[List[Any]], colored_cells: List[str] = None) -> 'SheetData':
@@ -31,18 +31,44 @@ def process_sheets_stream():
     spreadsheet_ids = request.args.getlist('sheet_id')
     small_batch_size = int(request.args.get('small_batch_size', 2))
     large_batch_size = int(request.args.get('large_batch_size', 10))
+    prefetch_depth = request.args.get('prefetch_depth', type=int)
+    # Sent by EventSource when it reconnects, to resume the stream session
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
 
     if not spreadsheet_ids:
         return jsonify({"error": "No spreadsheet IDs provided"}), 400
 
     def generate():
-        stream = stream_processed_contacts(spreadsheet_ids, continue_event, small_batch_size, large_batch_size)
+        stream = stream_processed_contacts(spreadsheet_ids, continue_event, small_batch_size, large_batch_size,
+                                           prefetch_depth, last_event_id)
         for item in stream:
             yield item
 
     return Response(stream_with_context(generate()), mimetype='text/event-stream')
 
 
+@app.route('/contact/<username>', methods=['GET'])
+def contact_details(username):
+    contact = ContactService.get_instance().get_contact(username)
+    if contact is None:
+        return jsonify({"error": "Contact not found"}), 404
+
+    # The full contact, including its Nubela profile, for what the card sent by /process_stream leaves out.
+    # Browsers keep it for a while and revalidate it by ETag afterwards.
+    response = Response(contact.model_dump_json(), mimetype='application/json')
+    response.cache_control.private = True
+    response.cache_control.max_age = app.config['CONTACT_DETAILS_MAX_AGE']
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@app.route('/rescore/<spreadsheet_id>', methods=['POST'])
+def rescore_contacts(spreadsheet_id):
+    # After the pq keywords of a spreadsheet were edited, re-picks the relevant experiences of its stored contacts
+    contacts = ContactService.get_instance().rescore_contacts(spreadsheet_id)
+    return jsonify({"status": "rescored", "count": len(contacts)})
+
+
 @app.route('/continue_processing', methods=['POST'])
 def continue_processing():
     continue_event.set()
@@ -57,13 +83,24 @@ def stop_processing():
 
 @app.route('/save', methods=['POST'])
 def save_data():
-    data = request.json
+    _save_entry(request.json)
+    return jsonify({"status": "queued"})
+
+
+@app.route('/save_batch', methods=['POST'])
+def save_batch():
+    entries = request.json.get('entries', [])
+    for entry in entries:
+        _save_entry(entry)
+    return jsonify({"status": "queued", "count": len(entries)})
+
+
+def _save_entry(data: dict):
     spreadsheet_id = data.get('sheet_id')
     row_number = data.get('row_number')
     entry_data = data.get('entry_data')
     username = data.get('username')
 
-    result = SpreadsheetService.get_instance().update_row(spreadsheet_id, "New Connections", row_number, entry_data)
+    # Written to the sheet in the background, together with other saves of the same spreadsheet
+    SpreadsheetService.get_instance().update_row(spreadsheet_id, "New Connections", row_number, entry_data)
     ContactService.get_instance().delete_contact(username)
-
-    return jsonify(result)
@@ -1,48 +1,167 @@
-from threading import Event
-from typing import List, Any, Generator
+import logging
+from collections import deque
+from itertools import islice
+from threading import Event, Thread
+from typing import List, Any, Generator, Tuple, Set, Deque, Optional
 from flask import current_app
 import orjson
 from pydantic import BaseModel
 from pydantic_core import Url
 
-from app.models import ContactData
+from app.models import ContactData, SheetRow
 from app.services.contact_service import ContactService
 from app.services.spreadsheet_service import SpreadsheetService
+from app.services.stream_session import StreamSession
+from app.utils.rate_governor import RateLimitExceeded
+
+OWNER_CHECK_INTERVAL = 1  # How often a paused stream checks that no other connection took its session, in seconds
+
+
+class UnprocessedRowCursor:
+    """
+    Queue of the unprocessed rows of one spreadsheet, built once and consumed as rows are served.
+
+    The rows are only recalculated when the spreadsheet's cache stamp changes, i.e. when the cached sheet was
+    rebuilt or invalidated; rows that were already consumed are never handed out again.
+    """
+
+    def __init__(self, spreadsheet_id: str, consumed_row_numbers: Set[int] = None):
+        self.spreadsheet_id = spreadsheet_id
+        self.spreadsheet_service = SpreadsheetService.get_instance()
+        self.consumed_row_numbers = consumed_row_numbers if consumed_row_numbers is not None else set()
+        self._rows: Deque[SheetRow] = deque()
+        self._stamp: Optional[str] = None
+        self._loaded = False
+
+    def has_more(self) -> bool:
+        self._refresh_if_invalidated()
+        return bool(self._rows)
+
+    def next_row(self) -> Optional[SheetRow]:
+        self._refresh_if_invalidated()
+        if not self._rows:
+            return None
+        row = self._rows.popleft()
+        self.consumed_row_numbers.add(row.row_number)
+        return row
+
+    def push_back(self, rows: List[SheetRow]):
+        """
+        Return rows that were taken but couldn't be processed, so they are handed out again first.
+        """
+        for row in reversed(rows):
+            self.consumed_row_numbers.discard(row.row_number)
+            self._rows.appendleft(row)
+
+    def peek(self, limit: int) -> List[SheetRow]:
+        self._refresh_if_invalidated()
+        return list(islice(self._rows, limit))
+
+    def _refresh_if_invalidated(self):
+        stamp = self.spreadsheet_service.get_cache_stamp(self.spreadsheet_id)
+        if self._loaded and stamp is not None and stamp == self._stamp:
+            return
+
+        spreadsheet_data = self.spreadsheet_service.get_spreadsheet(self.spreadsheet_id)
+        unprocessed_rows = self.spreadsheet_service.calculate_unprocessed_rows_in_sheet(
+            spreadsheet_data.new_connections) if spreadsheet_data else []
+        self._rows = deque(row for row in unprocessed_rows if row.row_number not in self.consumed_row_numbers)
+        self._stamp = self.spreadsheet_service.get_cache_stamp(self.spreadsheet_id)
+        self._loaded = True
 
 
 class ContactProcessor:
-    def __init__(self, spreadsheet_id: str, batch_size: int = 2):
+    def __init__(self, spreadsheet_id: str, batch_size: int = 2, processed_row_numbers: Set[int] = None):
         self.spreadsheet_id = spreadsheet_id
         self.batch_size = batch_size
         self.contact_service = ContactService.get_instance()
-        self.spreadsheet_service = SpreadsheetService.get_instance()
-        self.processed_row_numbers = set()
+        self.processed_row_numbers = processed_row_numbers if processed_row_numbers is not None else set()
+        self.cursor = UnprocessedRowCursor(spreadsheet_id, self.processed_row_numbers)
 
     def process_batch(self) -> List[ContactData]:
-        spreadsheet_data = self.spreadsheet_service.get_spreadsheet(self.spreadsheet_id)
-        unprocessed_rows = self.spreadsheet_service.calculate_unprocessed_rows_in_sheet(
-            spreadsheet_data.new_connections)
+        return self.process_rows(self.next_rows())
 
-        batch = []
-        for row in unprocessed_rows:
-            if len(batch) >= self.batch_size:
+    def next_rows(self) -> List[SheetRow]:
+        rows = []
+        while len(rows) < self.batch_size:
+            row = self.cursor.next_row()
+            if row is None:
                 break
-            if row.row_number in self.processed_row_numbers:
-                continue
-            try:
-                processed_contact = self.contact_service.get_or_create_contact(row, self.spreadsheet_id)
-                batch.append(processed_contact)
-                self.processed_row_numbers.add(row.row_number)
-            except Exception as e:
-                current_app.logger.error(f"Error processing contact: {str(e)}")
+            rows.append(row)
+        return rows
 
-        return batch
+    def process_rows(self, rows: List[SheetRow]) -> List[ContactData]:
+        if not rows:
+            return []
+        try:
+            return self.contact_service.get_or_create_contacts(rows, self.spreadsheet_id)
+        except RateLimitExceeded as e:
+            # Nothing was created, so the rows are retried rather than skipped
+            current_app.logger.warning(f"Rate limited while processing contacts, retrying later: {str(e)}")
+            self.cursor.push_back(rows)
+            return []
+        except Exception as e:
+            current_app.logger.error(f"Error processing contacts: {str(e)}")
+            return []
 
     def has_more_contacts(self) -> bool:
-        spreadsheet_data = self.spreadsheet_service.get_spreadsheet(self.spreadsheet_id)
-        unprocessed_rows = self.spreadsheet_service.calculate_unprocessed_rows_in_sheet(
-            spreadsheet_data.new_connections)
-        return any(row.row_number not in self.processed_row_numbers for row in unprocessed_rows)
+        return self.cursor.has_more()
+
+    def peek_unprocessed_rows(self, limit: int) -> List[SheetRow]:
+        return self.cursor.peek(limit)
+
+
+class ContactPrefetcher:
+    """
+    Enriches upcoming rows in a background thread while the stream is paused for the reviewer, so that
+    the contacts are already in the store when processing resumes.
+    """
+
+    def __init__(self, batches: List[Tuple[str, List[SheetRow]]]):
+        self.batches = batches
+        self.contact_service = ContactService.get_instance()
+        self._stop_event = Event()
+        self._thread = Thread(target=self._run, args=(current_app._get_current_object(),),
+                              name='contact-prefetcher', daemon=True)
+
+    @classmethod
+    def for_processors(cls, processors: List[ContactProcessor], depth: int) -> 'ContactPrefetcher':
+        """
+        Pick the next `depth` rows in the order the stream will serve them: one batch per spreadsheet, in turn.
+        """
+        upcoming = {processor: processor.peek_unprocessed_rows(depth) for processor in processors}
+        batches = []
+        remaining = depth
+        while remaining > 0 and any(upcoming.values()):
+            for processor, pending in upcoming.items():
+                batch = pending[:min(processor.batch_size, remaining)]
+                upcoming[processor] = pending[processor.batch_size:]
+                if batch:
+                    batches.append((processor.spreadsheet_id, batch))
+                    remaining -= len(batch)
+        return cls(batches)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop after the batch currently being enriched, so the stream never creates the same contact twice.
+        """
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self, app):
+        with app.app_context():
+            # Enriched in the batches of the stream, so that stopping only waits for the current one
+            for spreadsheet_id, rows in self.batches:
+                if self._stop_event.is_set():
+                    break
+                try:
+                    self.contact_service.get_or_create_contacts(rows, spreadsheet_id)
+                except Exception as e:
+                    logging.error(f"Error prefetching contacts of spreadsheet {spreadsheet_id}: {str(e)}")
 
 
 def _custom_json_encoder(obj: Any) -> Any:
@@ -58,28 +177,111 @@ def _dumps(v: Any, *, default: Any = None) -> str:
 
 
 def stream_processed_contacts(spreadsheet_ids: List[str], continue_event: Event, small_batch_size: int = 2,
-                              large_batch_size: int = 10) -> Generator[str, None, None]:
-    processors = {id: ContactProcessor(id, small_batch_size) for id in spreadsheet_ids}
-    total_processed = 0
+                              large_batch_size: int = 10, prefetch_depth: int = None,
+                              last_event_id: str = None) -> Generator[str, None, None]:
+    """
+    Stream enriched contacts as server-sent events, pausing for the reviewer every `large_batch_size` contacts.
+
+    A client reconnecting with the id of the last event it received resumes its session: it gets the events it
+    missed, and processing continues with the rows that haven't been served yet.
+    """
+    if prefetch_depth is None:
+        prefetch_depth = current_app.config['PREFETCH_DEPTH']
+
+    session = None
+    if last_event_id:
+        resumed_event = StreamSession.parse_event_id(last_event_id)
+        session = StreamSession.resume(resumed_event[0]) if resumed_event else None
+        if session is None:
+            current_app.logger.warning(f"Can't resume stream from event {last_event_id}, starting a new session")
+
+    if session:
+        current_app.logger.info(f"Resuming stream session {session.session_id} after event {resumed_event[1]}")
+        for message in session.events_after(resumed_event[1]):
+            yield message
+        if session.is_complete():
+            return
+        spreadsheet_ids = session.spreadsheet_ids
+        small_batch_size, large_batch_size = session.small_batch_size, session.large_batch_size
+        total_processed = session.contacts_since_pause()
+    else:
+        session = StreamSession.create(spreadsheet_ids, small_batch_size, large_batch_size)
+        total_processed = 0
+
+    processors = {id: ContactProcessor(id, small_batch_size, session.processed_row_numbers(id))
+                  for id in spreadsheet_ids}
+
+    if total_processed >= large_batch_size:
+        # The session was interrupted at a pause
+        if not session.is_paused():
+            yield session.send(_dumps({'await_user_action': True}), pause=True)
+            continue_event.clear()
+        if not _wait_for_reviewer(continue_event, session, list(processors.values()), prefetch_depth):
+            return
+        session.end_pause()
+        total_processed = 0
 
     while processors:
         for spreadsheet_id, processor in list(processors.items()):
+            if not session.is_owner():
+                current_app.logger.info(f"Stream session {session.session_id} was resumed by another connection")
+                return
+
             if not processor.has_more_contacts():
                 del processors[spreadsheet_id]
                 continue
 
-            batch = processor.process_batch()
+            rows = processor.next_rows()
+            batch = processor.process_rows(rows)
+            if not session.is_owner():
+                # Leave the rows to the connection that took over, which hasn't received them
+                return
+
+            # Rows pushed back after a rate limit aren't processed yet
+            row_numbers = [row.row_number for row in rows if row.row_number in processor.processed_row_numbers]
             if batch:
                 total_processed += len(batch)
-                yield f"data: {_dumps({'contacts': [contact.model_dump() for contact in batch]})}\n\n"
+                yield session.send(_dumps({'contacts': [contact.to_card() for contact in batch]}), spreadsheet_id,
+                                   row_numbers, contacts_since_pause=total_processed)
+            else:
+                session.mark_processed(spreadsheet_id, row_numbers)
 
             if total_processed >= large_batch_size:
                 current_app.logger.info(f"Processed {total_processed} contacts. Waiting for user action.")
-                yield "data: " + orjson.dumps({'await_user_action': True}).decode('utf-8') + "\n\n"
+                yield session.send(_dumps({'await_user_action': True}), pause=True)
                 continue_event.clear()
-                continue_event.wait()  # This will block until the event is set
+                if not _wait_for_reviewer(continue_event, session, list(processors.values()), prefetch_depth):
+                    current_app.logger.info(f"Stream session {session.session_id} was resumed by another "
+                                            f"connection while paused")
+                    return
+                session.end_pause()
                 total_processed = 0  # Reset the counter
                 current_app.logger.info("Received continue action. Resuming processing.")
 
     current_app.logger.info("All processors finished. Sending complete signal.")
-    yield "data: " + orjson.dumps({'complete': True}).decode('utf-8') + "\n\n"
+    yield session.send(_dumps({'complete': True}), complete=True)
+
+
+def _wait_for_reviewer(continue_event: Event, session: StreamSession, processors: List[ContactProcessor],
+                       prefetch_depth: int) -> bool:
+    """
+    Prefetch upcoming contacts until the reviewer continues, for as long as this connection owns the session.
+
+    :return: Whether this connection still owns the session, and so may go on serving it
+    """
+    if not session.is_owner():
+        return False
+
+    prefetcher = None
+    if prefetch_depth > 0:
+        prefetcher = ContactPrefetcher.for_processors(processors, prefetch_depth)
+        prefetcher.start()
+    try:
+        # Block until the event is set, or until another connection takes the session over
+        while not continue_event.wait(timeout=OWNER_CHECK_INTERVAL):
+            if not session.is_owner():
+                return False
+    finally:
+        if prefetcher:
+            prefetcher.stop()
+    return session.is_owner()
@@ -1,30 +1,35 @@
 # app/services/contact_service.py
 
-from datetime import datetime, timedelta
-from typing import List, Optional
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Dict
 
 from cleanco import basename
 from flask import current_app
-from orjson import orjson
-from sipbuild.generator.parser.tokens import keywords
-from tinydb import Query, TinyDB
 
 from app.models import ContactData, CompanyData, SheetRow, PqKeywords, SpreadsheetData
 from app.models.contact_models import ExperiencesWithMetadata
-from app.models.nubela_response_models import Experience, NubelaResponse
+from app.models.nubela_response_models import Experience, LazyNubelaResponse
+from app.services.contact_store import create_contact_store
+from app.services.enrichment_pipeline import EnrichmentPipeline, EnrichmentStage
+from app.services.experience_scoring import ContactExperiences, score_experiences
 from app.services.spreadsheet_service import SpreadsheetService
 from app.utils.cleaning_utils import clean_name
+from app.utils.company_cache import CompanyEnrichmentCache
 from app.utils.external_apis import get_nubela_data_for_contact, search_person_interviews_podcasts, \
-    search_company_case_studies, search_company_about_page
+    search_company_case_studies, search_company_about_page, perform_google_searches, company_about_page_query, \
+    company_case_studies_query, person_interviews_podcasts_query
 from app.utils.image_manager import ImageManager
+from app.utils.rate_governor import RateLimitExceeded
 
 
 class ContactService:
     _instance = None
 
     def __init__(self):
-        self.db = TinyDB(current_app.config['TINYDB_PATH'])
-        self.contacts = self.db.table('contacts')
+        self.store = create_contact_store(current_app.config)
+        self.enrichment_executor = ThreadPoolExecutor(max_workers=current_app.config['ENRICHMENT_MAX_WORKERS'],
+                                                      thread_name_prefix='enrichment')
 
     @classmethod
     def get_instance(cls):
@@ -33,53 +38,113 @@ class ContactService:
         return cls._instance
 
     def get_or_create_contact(self, row: SheetRow, spreadsheet_id: str) -> ContactData:
-        linkedin_username = row.get('contact_profile_link', '').split('/')[-2]
-
-        User = Query()
-        # noinspection PyTypeChecker
-        result = self.contacts.get(User.linkedin_username == linkedin_username)
-        if result:
-            return ContactData.model_validate(result)
-        else:
-            return self._create_contact(row, spreadsheet_id)
+        contacts = self.get_or_create_contacts([row], spreadsheet_id)
+        if not contacts:
+            raise ValueError(f"Could not create contact for row {row.row_number}")
+        return contacts[0]
+
+    def get_or_create_contacts(self, rows: List[SheetRow], spreadsheet_id: str) -> List[ContactData]:
+        """
+        Get the stored contacts for the rows, creating the missing ones together so that their web searches
+        share a single Apify run. Contacts stored with failed enrichment stages are created again. Rows whose
+        contact cannot be created are logged and left out.
+        """
+        contacts: Dict[int, ContactData] = {}
+        missing_rows = []
+        for row in rows:
+            result = self.store.get(self._linkedin_username(row.get('contact_profile_link', '')))
+            if result and not result.failed_stages:
+                contacts[row.row_number] = result
+            else:
+                missing_rows.append(row)
+
+        if missing_rows:
+            for contact in self._create_contacts(missing_rows, spreadsheet_id):
+                contacts[contact.row_number] = contact
+
+        return [contacts[row.row_number] for row in rows if row.row_number in contacts]
+
+    def get_contact(self, linkedin_username: str) -> Optional[ContactData]:
+        return self.store.get(linkedin_username)
 
     def save_contact(self, contact: ContactData):
-        User = Query()
-        # noinspection PyTypeChecker
-        existing = self.contacts.get(User.linkedin_username == contact.linkedin_username)
-        if existing:
-            # noinspection PyTypeChecker
-            self.contacts.update(orjson.loads(contact.model_dump_json()),
-                                 User.linkedin_username == contact.linkedin_username)
-        else:
-            self.contacts.insert(orjson.loads(contact.model_dump_json()))
+        self.store.save(contact)
 
     def delete_contact(self, linkedin_username: str):
-        User = Query()
-        # noinspection PyTypeChecker
-        deleted_user = self.contacts.remove(User.linkedin_username == linkedin_username)
+        deleted_user = self.store.delete(linkedin_username)
         if deleted_user:
             ImageManager.get_instance().delete_images_by_contact(linkedin_username)
 
-    def _create_contact(self, row: SheetRow, spreadsheet_id: str) -> ContactData:
+    def _create_contacts(self, rows: List[SheetRow], spreadsheet_id: str) -> List[ContactData]:
         colored_cells = SpreadsheetService.get_instance().get_spreadsheet(spreadsheet_id).new_connections.colored_cells
-        contact_data = self._initialize_contact_data(row, spreadsheet_id, colored_cells)
+        contacts = []
+        for row in rows:
+            try:
+                contacts.append(self._initialize_contact_data(row, spreadsheet_id, colored_cells))
+            except RateLimitExceeded:
+                raise
+            except Exception as e:
+                logging.error(f"Error initializing contact in row {row.row_number}: {str(e)}")
+
+        if not contacts:
+            return []
+
+        search_results = self.enrichment_executor.submit(perform_google_searches,
+                                                         self._collect_search_queries(contacts))
+        stage_results = self._build_enrichment_pipeline(search_results).run_many(contacts,
+                                                                                 shared={'search': search_results})
+
+        created = []
+        for contact_data, results in zip(contacts, stage_results):
+            contact_data.failed_stages = [stage for stage, succeeded in results.items() if not succeeded]
+            if contact_data.failed_stages:
+                logging.warning(f"Contact {contact_data.linkedin_username} is incomplete, enrichment stages "
+                                f"{contact_data.failed_stages} will be retried")
+            try:
+                self.store.save(contact_data)
+                created.append(contact_data)
+            except Exception as e:
+                logging.error(f"Error saving contact {contact_data.linkedin_username}: {str(e)}")
+        return created
 
-        self._add_company_links(contact_data)
-        self._add_media_links(contact_data)
-        self._add_nubela_data(contact_data)
-        self._add_relevant_experience(contact_data)
+    @staticmethod
+    def _collect_search_queries(contacts: List[ContactData]) -> List[str]:
+        company_cache = CompanyEnrichmentCache.get_instance()
+        queries = []
+        for contact_data in contacts:
+            if contact_data.company.website and not company_cache.get(contact_data.company.website):
+                queries.append(company_about_page_query(contact_data.company.website))
+                queries.append(company_case_studies_query(contact_data.company.website))
+            queries.append(person_interviews_podcasts_query(contact_data.parsed_name, contact_data.company.name))
+        return queries
+
+    def _build_enrichment_pipeline(self, search_results: Future) -> EnrichmentPipeline:
+        # All web searches of the batch run in one shared Apify call, alongside Nubela; the company and media
+        # stages only pick their results out of it. Relevant experience has to wait for the Nubela profile.
+        stages = [
+            EnrichmentStage('company_links',
+                            lambda contact: self._add_company_links(contact, search_results.result()),
+                            depends_on=['search']),
+            EnrichmentStage('media_links',
+                            lambda contact: self._add_media_links(contact, search_results.result()),
+                            depends_on=['search']),
+            EnrichmentStage('nubela', self._add_nubela_data),
+            EnrichmentStage('relevant_experience', self._add_relevant_experience, depends_on=['nubela']),
+        ]
+        return EnrichmentPipeline(stages, self.enrichment_executor,
+                                  default_timeout=current_app.config['ENRICHMENT_STAGE_TIMEOUT'], shared=['search'])
 
-        self.contacts.insert(contact_data.model_dump())
-        return contact_data
+    @staticmethod
+    def _linkedin_username(linkedin_profile_url: str) -> str:
+        return linkedin_profile_url.split('/')[-2] if linkedin_profile_url.endswith('/') else \
+            linkedin_profile_url.split('/')[-1]
 
     def _initialize_contact_data(self, row: SheetRow, spreadsheet_id: str, colored_cells: List[str]) -> ContactData:
         full_name = f"{row.get('contact_first_name', '')} {row.get('contact_last_name', '')}".strip()
         parsed_name = clean_name(full_name)
 
         linkedin_profile_url = row.get('contact_profile_link', '')
-        linkedin_username = linkedin_profile_url.split('/')[-2] if linkedin_profile_url.endswith('/') else \
-            linkedin_profile_url.split('/')[-1]
+        linkedin_username = self._linkedin_username(linkedin_profile_url)
 
         return ContactData(
             contact_first_name=parsed_name['first_name'],
@@ -111,24 +176,40 @@ class ContactService:
         return company_data
 
     @staticmethod
-    def _add_company_links(contact_data: ContactData):
-        if contact_data.company.website:
-            about_links = search_company_about_page(contact_data.company.website, contact_data)
-            case_study_links = search_company_case_studies(contact_data.company.website, contact_data.linkedin_username)
-            contact_data.company.about_links = about_links[:3] if about_links else []
-            contact_data.company.case_study_links = case_study_links if case_study_links else []
+    def _add_company_links(contact_data: ContactData, search_results: Optional[Dict[str, Dict]] = None):
+        website = contact_data.company.website
+        if not website:
+            return
+
+        company_cache = CompanyEnrichmentCache.get_instance()
+        cached_links = company_cache.get(website)
+        if cached_links:
+            contact_data.company.about_links = cached_links['about_links']
+            contact_data.company.case_study_links = cached_links['case_study_links']
+            return
+
+        about_links = search_company_about_page(website, contact_data, search_results)
+        case_study_links = search_company_case_studies(website, contact_data.linkedin_username, search_results)
+        contact_data.company.about_links = about_links[:3] if about_links else []
+        contact_data.company.case_study_links = case_study_links if case_study_links else []
+
+        # Only remember answers the search actually gave, not queries that went missing from a failed run
+        if search_results is not None and company_about_page_query(website) in search_results and \
+                company_case_studies_query(website) in search_results:
+            company_cache.set(website, contact_data.company.about_links, contact_data.company.case_study_links)
 
     @staticmethod
-    def _add_media_links(contact_data: ContactData):
+    def _add_media_links(contact_data: ContactData, search_results: Optional[Dict[str, Dict]] = None):
         media_links = search_person_interviews_podcasts(contact_data.parsed_name, contact_data.company.name,
-                                                        contact_data.linkedin_username)
+                                                        contact_data.linkedin_username,
+                                                        search_results=search_results)
         contact_data.interviews_and_podcasts = media_links if media_links else []
 
     @staticmethod
     def _add_nubela_data(contact_data: ContactData):
         if contact_data.contact_profile_link:
             nubela_data_and_pictures = get_nubela_data_for_contact(contact_data.contact_profile_link)
-            nubela_data: NubelaResponse = nubela_data_and_pictures.get('nubela_response')
+            nubela_data: LazyNubelaResponse = nubela_data_and_pictures.get('nubela_response')
             profile_picture = nubela_data_and_pictures.get('local_profile_pic_url')
             banner_picture = nubela_data_and_pictures.get('local_banner_pic_url')
 
@@ -157,45 +238,35 @@ class ContactService:
             )
             print(contact_data.linkedin_username, contact_data.relevant_experiences)
 
+    def rescore_contacts(self, spreadsheet_id: str) -> List[ContactData]:
+        """
+        Recompute the relevant experiences of every stored contact of a spreadsheet, e.g. after its pq keywords
+        changed, without fetching anything again.
+
+        :param spreadsheet_id: ID of the spreadsheet whose contacts to rescore
+        :return: The rescored contacts
+        """
+        spreadsheet_data = SpreadsheetService.get_instance().get_spreadsheet(spreadsheet_id)
+        if spreadsheet_data is None:
+            return []
+
+        keywords = spreadsheet_data.keywords
+        contacts = [contact for contact in self.store.list_by_spreadsheet(spreadsheet_id)
+                    if contact.nubela_response and contact.nubela_response.experiences]
+
+        scored = score_experiences(
+            [ContactExperiences(contact.nubela_response.experiences, contact.contact_job_title, contact.company.name)
+             for contact in contacts],
+            keywords
+        )
+        for contact, relevant_experiences in zip(contacts, scored):
+            contact.relevant_experiences = relevant_experiences
+            self.store.save(contact)
+        return contacts
+
     @staticmethod
     def _filter_out_relevant_experience(experiences_data: List[Experience], contact_job_title: str,
                                         current_company: str,
                                         keywords: PqKeywords) -> ExperiencesWithMetadata:
-        relevant_experiences = []
-        most_likely_current_title = contact_job_title
-        title_mismatch = False
-
-        # Sort experiences by start date, most recent first
-        sorted_experiences = sorted(
-            [exp for exp in experiences_data if exp.get_start_date() is not None],
-            key=lambda x: x.get_start_date(),
-            reverse=True
-        )
-
-        # Filter present experiences
-        present_experiences = [exp for exp in sorted_experiences if exp.is_current]
-
-        # Determine the correct job title
-        if present_experiences:
-            most_likely_current_title = present_experiences[0].title
-            if most_likely_current_title.lower() != contact_job_title.lower():
-                title_mismatch = True
-
-        for exp in sorted_experiences:
-            start_date = exp.get_start_date()
-            if start_date is None:
-                continue  # Skip experiences without a valid start date
-
-            # Check if the experience is relevant based on the new criteria
-            is_relevant = (
-                    (exp.is_current and exp.title == most_likely_current_title and exp.duration <= timedelta(
-                        days=180)) or
-                    (exp.company.lower() == current_company.lower() and exp.duration >= timedelta(days=3650))
-                # 10 years
-            )
-
-            if is_relevant and exp.matches_keywords(keywords):
-                relevant_experiences.append(exp)
-
-        return ExperiencesWithMetadata(experiences=relevant_experiences, title_mismatch=title_mismatch,
-                                       most_likely_current_title=most_likely_current_title)
+        return score_experiences([ContactExperiences(experiences_data, contact_job_title, current_company)],
+                                 keywords)[0]
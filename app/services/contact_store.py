@@ -0,0 +1,170 @@
+# app/services/contact_store.py
+
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import orjson
+from tinydb import Query, TinyDB
+
+from app.models import ContactData
+
+
+class ContactStore(ABC):
+    """
+    Storage backend for enriched contacts, keyed by LinkedIn username.
+    """
+
+    @abstractmethod
+    def get(self, linkedin_username: str) -> Optional[ContactData]:
+        pass
+
+    @abstractmethod
+    def get_by_row(self, spreadsheet_id: str, row_number: int) -> Optional[ContactData]:
+        pass
+
+    @abstractmethod
+    def list_by_spreadsheet(self, spreadsheet_id: str) -> List[ContactData]:
+        pass
+
+    @abstractmethod
+    def save(self, contact: ContactData):
+        """Insert the contact, or replace the stored contact with the same LinkedIn username."""
+        pass
+
+    @abstractmethod
+    def delete(self, linkedin_username: str) -> bool:
+        """Delete the contact and return whether anything was removed."""
+        pass
+
+
+class TinyDBContactStore(ContactStore):
+    def __init__(self, path: str):
+        self.db = TinyDB(path)
+        self.contacts = self.db.table('contacts')
+
+    def get(self, linkedin_username: str) -> Optional[ContactData]:
+        User = Query()
+        # noinspection PyTypeChecker
+        result = self.contacts.get(User.linkedin_username == linkedin_username)
+        return ContactData.model_validate(result) if result else None
+
+    def get_by_row(self, spreadsheet_id: str, row_number: int) -> Optional[ContactData]:
+        User = Query()
+        # noinspection PyTypeChecker
+        result = self.contacts.get((User.spreadsheet_id == spreadsheet_id) & (User.row_number == row_number))
+        return ContactData.model_validate(result) if result else None
+
+    def list_by_spreadsheet(self, spreadsheet_id: str) -> List[ContactData]:
+        User = Query()
+        # noinspection PyTypeChecker
+        return [ContactData.model_validate(result) for result in self.contacts.search(
+            User.spreadsheet_id == spreadsheet_id)]
+
+    def save(self, contact: ContactData):
+        User = Query()
+        # noinspection PyTypeChecker
+        self.contacts.upsert(orjson.loads(contact.model_dump_json()),
+                             User.linkedin_username == contact.linkedin_username)
+
+    def delete(self, linkedin_username: str) -> bool:
+        User = Query()
+        # noinspection PyTypeChecker
+        return bool(self.contacts.remove(User.linkedin_username == linkedin_username))
+
+
+class SQLiteContactStore(ContactStore):
+    """
+    Contacts stored as JSON documents in SQLite, with indexed lookups by username and by spreadsheet row.
+
+    The database runs in WAL mode so readers never block on a writer, and every thread gets its own connection.
+    """
+
+    SCHEMA = (
+        # The primary key doubles as the unique index on linkedin_username
+        """CREATE TABLE IF NOT EXISTS contacts (
+            linkedin_username TEXT PRIMARY KEY,
+            spreadsheet_id TEXT NOT NULL,
+            row_number INTEGER NOT NULL,
+            data TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_contacts_spreadsheet_row ON contacts (spreadsheet_id, row_number)",
+        "CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    )
+
+    def __init__(self, path: str, tinydb_path: Optional[str] = None):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+        if tinydb_path:
+            self._migrate_from_tinydb(tinydb_path)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, linkedin_username: str) -> Optional[ContactData]:
+        row = self._connection().execute(
+            "SELECT data FROM contacts WHERE linkedin_username = ?", (linkedin_username,)).fetchone()
+        return ContactData.model_validate_json(row[0]) if row else None
+
+    def get_by_row(self, spreadsheet_id: str, row_number: int) -> Optional[ContactData]:
+        row = self._connection().execute(
+            "SELECT data FROM contacts WHERE spreadsheet_id = ? AND row_number = ?",
+            (spreadsheet_id, row_number)).fetchone()
+        return ContactData.model_validate_json(row[0]) if row else None
+
+    def list_by_spreadsheet(self, spreadsheet_id: str) -> List[ContactData]:
+        rows = self._connection().execute(
+            "SELECT data FROM contacts WHERE spreadsheet_id = ? ORDER BY row_number", (spreadsheet_id,)).fetchall()
+        return [ContactData.model_validate_json(row[0]) for row in rows]
+
+    def save(self, contact: ContactData):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO contacts (linkedin_username, spreadsheet_id, row_number, data) "
+                "VALUES (?, ?, ?, ?)",
+                (contact.linkedin_username, contact.spreadsheet_id, contact.row_number, contact.model_dump_json()))
+
+    def delete(self, linkedin_username: str) -> bool:
+        with self._connection() as connection:
+            cursor = connection.execute("DELETE FROM contacts WHERE linkedin_username = ?", (linkedin_username,))
+            return cursor.rowcount > 0
+
+    def _migrate_from_tinydb(self, tinydb_path: str):
+        """
+        One-shot import of the contacts in an existing TinyDB file. The TinyDB file itself is left untouched.
+        """
+        with self._connection() as connection:
+            migrated = connection.execute("SELECT value FROM metadata WHERE key = 'tinydb_migrated'").fetchone()
+            if migrated or not os.path.exists(tinydb_path):
+                return
+
+            documents = TinyDB(tinydb_path).table('contacts').all()
+            connection.executemany(
+                "INSERT OR IGNORE INTO contacts (linkedin_username, spreadsheet_id, row_number, data) "
+                "VALUES (?, ?, ?, ?)",
+                [(document['linkedin_username'], document['spreadsheet_id'], document['row_number'],
+                  orjson.dumps(document).decode('utf-8'))
+                 for document in documents if document.get('linkedin_username')])
+            connection.execute("INSERT INTO metadata (key, value) VALUES ('tinydb_migrated', ?)", (tinydb_path,))
+        logging.info(f"Migrated {len(documents)} contacts from {tinydb_path} to {self.path}")
+
+
+def create_contact_store(config) -> ContactStore:
+    backend = config['CONTACT_STORE_BACKEND']
+    if backend == 'sqlite':
+        return SQLiteContactStore(config['SQLITE_PATH'], tinydb_path=config['TINYDB_PATH'])
+    if backend == 'tinydb':
+        return TinyDBContactStore(config['TINYDB_PATH'])
+    raise ValueError(f"Unknown contact store backend: {backend}")
@@ -0,0 +1,171 @@
+# app/services/enrichment_pipeline.py
+
+import logging
+from concurrent.futures import Executor, Future, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import current_app
+
+from app.models import ContactData
+
+
+@dataclass
+class EnrichmentStage:
+    name: str
+    run: Callable[[ContactData], None]
+    depends_on: List[str] = field(default_factory=list)
+    timeout: Optional[float] = None
+
+
+class EnrichmentPipeline:
+    """
+    Runs the enrichment stages of a contact as a small dependency graph.
+
+    Every stage whose dependencies have completed is submitted to the shared executor straight away, so
+    independent remote calls overlap and a contact takes roughly as long as its slowest chain of stages.
+    A stage that fails or exceeds its timeout is logged and its dependents are skipped.
+
+    Each stage works on its own copy of the contact, and the fields it changed are copied back once it completes
+    in time. A stage that timed out can't be stopped, but whatever it still writes goes to its copy and is ignored.
+
+    Stages may also depend on shared work done once for a whole batch of contacts, such as a batched search.
+    Such dependencies are declared in `shared` and supplied as futures when the pipeline is run.
+    """
+
+    def __init__(self, stages: List[EnrichmentStage], executor: Executor, default_timeout: Optional[float] = None,
+                 shared: List[str] = ()):
+        self.stages = {stage.name: stage for stage in stages}
+        self.executor = executor
+        self.default_timeout = default_timeout
+        self.shared = set(shared)
+        self._validate()
+
+    def _validate(self):
+        for stage in self.stages.values():
+            unknown = [name for name in stage.depends_on if name not in self.stages and name not in self.shared]
+            if unknown:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {unknown}")
+
+        # Stages in a cycle would never become ready, so run_many would quietly never run them
+        remaining = {stage.name: {name for name in stage.depends_on if name in self.stages}
+                     for stage in self.stages.values()}
+        while remaining:
+            ready = [name for name, dependencies in remaining.items() if not dependencies]
+            if not ready:
+                raise ValueError(f"Stages depend on each other in a cycle: {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+            for dependencies in remaining.values():
+                dependencies.difference_update(ready)
+
+    def run(self, contact_data: ContactData, shared: Dict[str, Future] = None) -> Dict[str, bool]:
+        """
+        Run every stage against the contact.
+
+        :param contact_data: The contact to enrich, mutated in place by the stages
+        :param shared: Futures for the shared dependencies declared on the pipeline
+        :return: A mapping of stage name to whether the stage completed successfully
+        """
+        return self.run_many([contact_data], shared)[0]
+
+    def run_many(self, contacts: List[ContactData], shared: Dict[str, Future] = None) -> List[Dict[str, bool]]:
+        """
+        Run every stage against every contact, interleaving the stages of all contacts on the executor.
+
+        :param contacts: The contacts to enrich, mutated in place by the stages
+        :param shared: Futures for the shared dependencies declared on the pipeline
+        :return: For each contact, a mapping of stage name to whether the stage completed successfully
+        """
+        shared = shared or {}
+        missing = self.shared - set(shared)
+        if missing:
+            raise ValueError(f"Missing shared dependencies: {sorted(missing)}")
+
+        app = current_app._get_current_object()
+        results: List[Dict[str, bool]] = [{} for _ in contacts]
+        shared_results: Dict[str, bool] = {}
+        running: Dict[Future, tuple] = {}
+        submitted = set()
+
+        for name, future in shared.items():
+            timeout = self.default_timeout
+            running[future] = (None, name, monotonic() + timeout if timeout is not None else None, None)
+
+        def dependency_result(index: int, dependency: str) -> Optional[bool]:
+            return shared_results.get(dependency) if dependency in self.shared else results[index].get(dependency)
+
+        def submit_ready():
+            for index, contact_data in enumerate(contacts):
+                for stage in self.stages.values():
+                    if (index, stage.name) in submitted or stage.name in results[index]:
+                        continue
+                    dependencies = [dependency_result(index, dep) for dep in stage.depends_on]
+                    if any(result is False for result in dependencies):
+                        logging.warning(f"Skipping stage '{stage.name}' for {contact_data.linkedin_username}: "
+                                        f"a dependency did not complete")
+                        results[index][stage.name] = False
+                        continue
+                    if all(dependencies):
+                        timeout = stage.timeout if stage.timeout is not None else self.default_timeout
+                        deadline = monotonic() + timeout if timeout is not None else None
+                        working_copy = contact_data.model_copy(deep=True)
+                        future = self.executor.submit(self._run_stage, app, stage, working_copy)
+                        running[future] = (index, stage.name, deadline, (working_copy, dict(contact_data)))
+                        submitted.add((index, stage.name))
+
+        def record(index: Optional[int], name: str, succeeded: bool):
+            if index is None:
+                shared_results[name] = succeeded
+            else:
+                results[index][name] = succeeded
+
+        def describe(index: Optional[int], name: str) -> str:
+            return f"'{name}'" if index is None else f"'{name}' for {contacts[index].linkedin_username}"
+
+        submit_ready()
+        while running:
+            deadlines = [deadline for _, _, deadline, _ in running.values() if deadline is not None]
+            wait_timeout = max(0.0, min(deadlines) - monotonic()) if deadlines else None
+            done, _ = wait(list(running), timeout=wait_timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                index, name, _, copies = running.pop(future)
+                try:
+                    future.result()
+                    if copies is not None:
+                        self._apply_changes(contacts[index], *copies)
+                    record(index, name, True)
+                except Exception as e:
+                    logging.error(f"Stage {describe(index, name)} failed: {str(e)}")
+                    record(index, name, False)
+
+            now = monotonic()
+            for future, (index, name, deadline, _) in list(running.items()):
+                if deadline is not None and now >= deadline:
+                    # A stage that has started keeps running, but its copy is dropped along with its result
+                    future.cancel()
+                    running.pop(future)
+                    logging.error(f"Stage {describe(index, name)} timed out")
+                    record(index, name, False)
+
+            submit_ready()
+
+        return results
+
+    @staticmethod
+    def _apply_changes(contact_data: ContactData, working_copy: ContactData, fields_before: Dict[str, Any]):
+        """
+        Copy the fields a stage changed on its copy of the contact back to the contact.
+
+        :param fields_before: The contact's fields when the stage was submitted
+        """
+        for name, value in working_copy:
+            if value != fields_before[name]:
+                setattr(contact_data, name, value)
+
+    @staticmethod
+    def _run_stage(app, stage: EnrichmentStage, contact_data: ContactData):
+        with app.app_context():
+            stage.run(contact_data)
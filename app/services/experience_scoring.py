@@ -0,0 +1,115 @@
+# app/services/experience_scoring.py
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from app.models import PqKeywords
+from app.models.contact_models import ExperiencesWithMetadata
+from app.models.nubela_response_models import Date, Experience
+
+RECENT_ROLE_MAX_DURATION = np.timedelta64(180, 'D')
+LONG_TENURE_MIN_DURATION = np.timedelta64(3650, 'D')  # 10 years
+
+
+@dataclass
+class ContactExperiences:
+    experiences: List[Experience]
+    job_title: str
+    company_name: str
+
+
+def score_experiences(contacts: Sequence[ContactExperiences], keywords: PqKeywords,
+                      now: Optional[datetime] = None) -> List[ExperiencesWithMetadata]:
+    """
+    Pick the relevant experiences of many contacts at once.
+
+    The dates of all experiences are converted to NumPy arrays once, and durations, current roles and
+    same-company tenure are computed over the whole batch. Only the experiences that pass those checks are
+    matched against the keywords.
+
+    An experience is relevant if it is the contact's current role and started at most 180 days ago, or it is at
+    the contact's company and lasted at least 10 years, and its title matches the keywords. Experiences without a
+    start date are ignored, and the relevant ones are returned most recent first.
+
+    :param contacts: The experiences, job title and company name from the sheet of each contact
+    :param keywords: The keywords of the contacts' spreadsheet
+    :param now: End date of ongoing experiences, the current time by default
+    :return: The relevant experiences of each contact, in the order of `contacts`
+    """
+    dated = [(owner, experience) for owner, contact in enumerate(contacts) for experience in contact.experiences
+             if experience.starts_at and experience.starts_at.year]
+    if not dated:
+        return [ExperiencesWithMetadata(experiences=[], title_mismatch=False,
+                                        most_likely_current_title=contact.job_title) for contact in contacts]
+
+    owners = np.fromiter((owner for owner, _ in dated), dtype=np.int64, count=len(dated))
+    starts = _to_datetime64([experience.starts_at for _, experience in dated])
+
+    # Most recent first within each contact; both sorts are stable so ties keep their original order
+    order = np.argsort(-starts.astype(np.int64), kind='stable')
+    order = order[np.argsort(owners[order], kind='stable')]
+    experiences = [dated[i][1] for i in order]
+    owners = owners[order]
+    starts = starts[order]
+    ends = _to_datetime64([experience.ends_at for experience in experiences])
+
+    is_current = np.fromiter((experience.ends_at is None for experience in experiences), dtype=bool,
+                             count=len(experiences))
+    now64 = np.datetime64(now or datetime.now(), 's')
+    durations = np.where(np.isnat(ends), now64, ends) - starts
+
+    # Experiences without a title have an empty one, which matches no keywords
+    titles = np.array([experience.title or '' for experience in experiences], dtype=object)
+    companies = np.array([experience.company.lower() if experience.company is not None else None
+                          for experience in experiences], dtype=object)
+
+    # Each contact's rows are a contiguous slice of the sorted arrays
+    bounds = np.searchsorted(owners, np.arange(len(contacts) + 1))
+    current_titles = np.empty(len(contacts), dtype=object)
+    title_mismatches = np.zeros(len(contacts), dtype=bool)
+    for owner, contact in enumerate(contacts):
+        current = np.flatnonzero(is_current[bounds[owner]:bounds[owner + 1]])
+        # A current role without a title says nothing about the contact's title, so the sheet's one is kept
+        if current.size and titles[bounds[owner] + current[0]]:
+            current_titles[owner] = titles[bounds[owner] + current[0]]
+            title_mismatches[owner] = current_titles[owner].lower() != contact.job_title.lower()
+        else:
+            current_titles[owner] = contact.job_title
+    contact_companies = np.array([contact.company_name.lower() for contact in contacts], dtype=object)
+
+    candidates = (
+            (is_current & (titles == current_titles[owners]) & (durations <= RECENT_ROLE_MAX_DURATION)) |
+            ((companies == contact_companies[owners]) & (durations >= LONG_TENURE_MIN_DURATION))
+    )
+
+    relevant_experiences: List[List[Experience]] = [[] for _ in contacts]
+    matcher = keywords.get_matcher()
+    for i in np.flatnonzero(candidates):
+        if titles[i] and matcher.matches(titles[i]):
+            relevant_experiences[owners[i]].append(experiences[i])
+
+    return [ExperiencesWithMetadata(experiences=relevant_experiences[owner],
+                                    title_mismatch=bool(title_mismatches[owner]),
+                                    most_likely_current_title=current_titles[owner])
+            for owner in range(len(contacts))]
+
+
+def _to_datetime64(dates: List[Optional[Date]]) -> np.ndarray:
+    """
+    Convert partial dates to datetime64, with a missing month or day meaning the first one. Dates without a year
+    become NaT.
+    """
+    has_year = np.fromiter((bool(date and date.year) for date in dates), dtype=bool, count=len(dates))
+    years = np.fromiter((date.year if date and date.year else 1970 for date in dates), dtype=np.int64,
+                        count=len(dates))
+    months = np.fromiter(((date.month or 1) if date else 1 for date in dates), dtype=np.int64, count=len(dates))
+    days = np.fromiter(((date.day or 1) if date else 1 for date in dates), dtype=np.int64, count=len(dates))
+
+    result = ((years - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (months - 1)).astype(
+        'datetime64[D]') + (days - 1)
+    result = result.astype('datetime64[s]')
+    result[~has_year] = np.datetime64('NaT')
+    return result
@@ -0,0 +1,210 @@
+# app/services/sheet_write_queue.py
+
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Tuple
+from uuid import uuid4
+
+import orjson
+from flask import current_app
+from googleapiclient.errors import HttpError
+
+from app.utils.google_utils.google_sheets import fetch_header_row_from_google, update_sheets_rows
+from app.utils.redis_cache import RedisCache
+
+
+class SheetWriteQueue:
+    """
+    Write-behind queue for row updates to Google Sheets, kept in Redis so that queued updates survive a crash and
+    any worker can write them.
+
+    Updates are queued per cell, a later value of a cell replacing the earlier one, and collected for
+    WRITE_BEHIND_INTERVAL seconds before they are written with one batchUpdate per spreadsheet. One worker at a
+    time writes a spreadsheet: it moves the queued updates aside and deletes them only once they are written, so
+    updates queued meanwhile wait for the next write. Header rows, which map column names to columns, are cached
+    for SHEET_HEADER_CACHE_TTL.
+
+    A failed write is retried with exponential backoff, up to WRITE_BEHIND_MAX_BACKOFF seconds apart, until it
+    succeeds. Only updates the Sheets API rejects outright are dropped, and the cached rows of their sheets are
+    invalidated so they don't show values the sheet doesn't have. Every worker also looks for updates queued by
+    the others every WRITE_BEHIND_POLL_INTERVAL seconds, which picks up the ones left by a worker that died.
+    """
+
+    _instance = None
+    PENDING_KEY = 'sheet_writes:pending'
+    LOCK_TIMEOUT = 120  # Longest a single write may hold a spreadsheet's queue, in seconds
+    PERMANENT_ERROR_STATUSES = (400, 403, 404)  # Sheets API answers that retrying won't change
+    REVISION_EXPIRY = timedelta(hours=24)  # As long as the cached sheets (SpreadsheetService.CACHE_EXPIRY)
+
+    # Drops a spreadsheet from the pending set unless it still has queued or in-flight updates. Atomic, so it
+    # can't drop a spreadsheet that enqueue has just added updates to.
+    RELEASE_SCRIPT = """
+        if redis.call('EXISTS', KEYS[2]) == 0 and redis.call('EXISTS', KEYS[3]) == 0 then
+            redis.call('SREM', KEYS[1], ARGV[1])
+        end
+    """
+
+    def __init__(self):
+        self.interval = current_app.config['WRITE_BEHIND_INTERVAL']
+        self.poll_interval = current_app.config['WRITE_BEHIND_POLL_INTERVAL']
+        self.max_backoff = current_app.config['WRITE_BEHIND_MAX_BACKOFF']
+        self.header_ttl = current_app.config['SHEET_HEADER_CACHE_TTL']
+        self.cache = RedisCache.get_instance()
+        self.redis = self.cache.redis
+        self._release = self.redis.register_script(self.RELEASE_SCRIPT)
+        self._wake = threading.Event()
+        # The first pass writes whatever is left queued, without waiting for the poll interval
+        self._wake.set()
+        self._app = current_app._get_current_object()
+        self._thread = threading.Thread(target=self._run, name='sheet-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def enqueue(self, spreadsheet_id: str, sheet_name: str, row_number: int, updates: Dict[str, Any]):
+        """
+        Queue new cell values for a row.
+
+        :param spreadsheet_id: ID of the Google Spreadsheet
+        :param sheet_name: Name of the sheet within the spreadsheet
+        :param row_number: The row number to update (1-indexed)
+        :param updates: A dictionary where keys are column names and values are the new cell values
+        """
+        cells = {orjson.dumps([sheet_name, row_number, column_name]): orjson.dumps(value)
+                 for column_name, value in updates.items()}
+        if not cells:
+            return
+
+        pipeline = self.redis.pipeline(transaction=True)
+        pipeline.hset(self._queue_key(spreadsheet_id), mapping=cells)
+        pipeline.sadd(self.PENDING_KEY, spreadsheet_id)
+        pipeline.execute()
+        self._wake.set()
+
+    def flush(self):
+        """
+        Write everything that is queued now, except for spreadsheets that are waiting to retry a failed write or
+        that another worker is writing.
+        """
+        with self._app.app_context():
+            for spreadsheet_id in self.redis.smembers(self.PENDING_KEY):
+                spreadsheet_id = spreadsheet_id.decode('utf-8')
+                try:
+                    self._flush_spreadsheet(spreadsheet_id)
+                except Exception as e:
+                    logging.error(f"Error flushing queued updates of spreadsheet {spreadsheet_id}: {str(e)}")
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=self.poll_interval)
+            self._wake.clear()
+            # Give other updates of the same spreadsheets the time to arrive
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error flushing queued sheet updates: {str(e)}")
+
+    def _flush_spreadsheet(self, spreadsheet_id: str):
+        retry = self.redis.get(self._retry_key(spreadsheet_id))
+        if retry and orjson.loads(retry)['next_attempt'] > time.time():
+            return
+
+        lock = self.cache.lock(self._queue_key(spreadsheet_id), timeout=self.LOCK_TIMEOUT, blocking_timeout=0)
+        if not lock.acquire():
+            return
+        try:
+            queue_key, in_flight_key = self._queue_key(spreadsheet_id), self._in_flight_key(spreadsheet_id)
+            # Updates left in flight by a failed or interrupted write are written before newer ones
+            if not self.redis.exists(in_flight_key) and self.redis.exists(queue_key):
+                self.redis.rename(queue_key, in_flight_key)
+
+            cells = self.redis.hgetall(in_flight_key)
+            if cells:
+                self._write(spreadsheet_id, cells)
+            self._release(keys=[self.PENDING_KEY, queue_key, in_flight_key], args=[spreadsheet_id])
+        finally:
+            lock.release()
+
+    def get_unwritten_updates(self, spreadsheet_id: str) -> Dict[Tuple[str, int], Dict[str, Any]]:
+        """
+        Updates of a spreadsheet that are queued or being written, by sheet name and row number.
+        """
+        rows: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        # Queued updates are newer than the ones in flight
+        for key in (self._in_flight_key(spreadsheet_id), self._queue_key(spreadsheet_id)):
+            self._add_cells(rows, self.redis.hgetall(key))
+        return rows
+
+    @staticmethod
+    def _add_cells(rows: Dict[Tuple[str, int], Dict[str, Any]], cells: Dict[bytes, bytes]):
+        for cell, value in cells.items():
+            sheet_name, row_number, column_name = orjson.loads(cell)
+            rows.setdefault((sheet_name, row_number), {})[column_name] = orjson.loads(value)
+
+    def _write(self, spreadsheet_id: str, cells: Dict[bytes, bytes]):
+        rows: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._add_cells(rows, cells)
+        sheet_names = {sheet_name for sheet_name, _ in rows}
+
+        try:
+            headers = {sheet_name: self._get_header(spreadsheet_id, sheet_name) for sheet_name in sheet_names}
+            update_sheets_rows(spreadsheet_id, [(sheet_name, row_number, updates)
+                                                for (sheet_name, row_number), updates in rows.items()], headers)
+        except HttpError as e:
+            if e.resp.status not in self.PERMANENT_ERROR_STATUSES:
+                self._schedule_retry(spreadsheet_id, len(rows), e)
+                return
+            logging.error(f"Sheets rejected the updates of {len(rows)} rows of spreadsheet {spreadsheet_id}, "
+                          f"dropping them: {str(e)}")
+            self._invalidate_cached_sheets(spreadsheet_id, sheet_names)
+        except Exception as e:
+            self._schedule_retry(spreadsheet_id, len(rows), e)
+            return
+
+        self.redis.delete(self._in_flight_key(spreadsheet_id), self._retry_key(spreadsheet_id))
+
+    def _schedule_retry(self, spreadsheet_id: str, row_count: int, error: Exception):
+        retry = self.redis.get(self._retry_key(spreadsheet_id))
+        attempts = (orjson.loads(retry)['attempts'] if retry else 0) + 1
+        delay = min(2 ** attempts, self.max_backoff)
+        logging.error(f"Error writing {row_count} rows to spreadsheet {spreadsheet_id} (attempt {attempts}), "
+                      f"retrying in {delay}s: {str(error)}")
+        self.redis.set(self._retry_key(spreadsheet_id),
+                       orjson.dumps({'attempts': attempts, 'next_attempt': time.time() + delay}))
+
+    def _invalidate_cached_sheets(self, spreadsheet_id: str, sheet_names: List[str]):
+        # Without its metadata a cached sheet is reloaded from Google (see SpreadsheetService._read_sheet), and a
+        # new revision keeps workers from reusing spreadsheets they composed from it
+        for sheet_name in sheet_names:
+            self.cache.delete(f"sheet_meta:{spreadsheet_id}:{sheet_name}")
+            self.cache.delete(f"sheet_header:{spreadsheet_id}:{sheet_name}")
+        self.cache.set(f"spreadsheet_revision:{spreadsheet_id}", uuid4().hex, expire=self.REVISION_EXPIRY)
+
+    def _get_header(self, spreadsheet_id: str, sheet_name: str) -> List[str]:
+        cache_key = f"sheet_header:{spreadsheet_id}:{sheet_name}"
+        header = self.cache.get(cache_key)
+        if header is None:
+            header = fetch_header_row_from_google(spreadsheet_id, sheet_name)
+            self.cache.set(cache_key, header, expire=self.header_ttl)
+        return header
+
+    @staticmethod
+    def _queue_key(spreadsheet_id: str) -> str:
+        return f"sheet_writes:{spreadsheet_id}"
+
+    @staticmethod
+    def _in_flight_key(spreadsheet_id: str) -> str:
+        return f"sheet_writes:{spreadsheet_id}:in_flight"
+
+    @staticmethod
+    def _retry_key(spreadsheet_id: str) -> str:
+        return f"sheet_writes:{spreadsheet_id}:retry"
@@ -1,21 +1,60 @@
-from typing import List, Optional
+import hashlib
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Callable, Any, Dict, Tuple
 from datetime import timedelta
+from uuid import uuid4
 
+import orjson
 from flask import current_app
 
 from app.models import SpreadsheetData, SheetData, PqKeywords, SheetRow
-from app.utils.google_utils.google_drive import list_files_in_folder
-from app.utils.google_utils.google_sheets import fetch_sheet_names_from_google, fetch_sheet_data_from_google, \
-    fetch_colored_cells_from_google, update_sheet_rows
+from app.models.sheet_models import KeywordMatcher
+from app.utils.google_utils.google_drive import list_files_in_folder, get_file_version
+from app.utils.google_utils.google_sheets import fetch_sheet_names_from_google, fetch_sheets_data_from_google, \
+    fetch_colored_cells_from_google
+from app.services.sheet_write_queue import SheetWriteQueue
 from app.utils.redis_cache import RedisCache
 
 
 class SpreadsheetService:
+    """
+    Spreadsheets from the Drive folder, cached in Redis and served from the cache while they're being reloaded.
+
+    Cached spreadsheets are reloaded when their Drive version moves past the one they were loaded at. Versions come
+    from listing the folder every DRIVE_POLL_INTERVAL seconds, which one worker does at a time. For spreadsheets
+    whose version isn't known, e.g. because polling is off, cached copies are reloaded after CACHE_SOFT_TTL.
+    """
+
     _instance = None
-    CACHE_EXPIRY = timedelta(hours=1)  # Set cache expiry to 1 hour
+    CACHE_SOFT_TTL = timedelta(hours=1)  # Without a known Drive version, cached spreadsheets are reloaded after this
+    CACHE_EXPIRY = timedelta(hours=24)  # Past this, cached data is gone and must be loaded inline
+    REFRESH_RETRY_DELAY = timedelta(minutes=5)
+    COLORED_CELLS_EXPIRY = timedelta(days=1)  # Bounds how long recolouring a header without renaming goes unnoticed
+    # Versions the folder poll hasn't confirmed for this long, or three poll intervals if longer, are dropped
+    DRIVE_VERSION_EXPIRY = timedelta(minutes=10)
+    POLL_LOCK_SHARE = 0.9  # Of the poll interval, how long listing the folder keeps other workers from doing it
+    LOAD_LOCK_TIMEOUT = 120  # Longest a single load from Google may hold the shared lock, in seconds
 
     def __init__(self):
         self.cache = RedisCache.get_instance()
+        # Locks disappear once no load is holding or waiting for them
+        self._load_locks: weakref.WeakValueDictionary[str, threading.Lock] = weakref.WeakValueDictionary()
+        self._load_locks_guard = threading.Lock()
+        self._refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='spreadsheet-refresh')
+        self._refreshing = set()
+        self._refreshing_guard = threading.Lock()
+        self._keyword_matchers: Dict[str, Tuple[Tuple[Tuple[str, ...], ...], KeywordMatcher]] = {}
+        # Spreadsheets composed from the cache, by the cache stamp and row revision they were composed at
+        self._spreadsheets: Dict[str, Tuple[Tuple[str, Optional[str]], SpreadsheetData]] = {}
+        self._app = current_app._get_current_object()
+        self.poll_interval = current_app.config['DRIVE_POLL_INTERVAL']
+        self.drive_version_expiry = max(self.DRIVE_VERSION_EXPIRY, timedelta(seconds=3 * self.poll_interval))
+        if self.poll_interval:
+            threading.Thread(target=self._run_folder_poll, name='drive-folder-poll', daemon=True).start()
 
     @classmethod
     def get_instance(cls):
@@ -24,50 +63,297 @@ class SpreadsheetService:
         return cls._instance
 
     def get_spreadsheet(self, spreadsheet_id: str, name='') -> Optional[SpreadsheetData]:
-        # Try to get the entire spreadsheet data from cache
+        # Try to compose the spreadsheet from its cached sheets
         cache_key = f"spreadsheet:{spreadsheet_id}"
         cached_data = self.cache.get(cache_key)
-        if cached_data:
-            return SpreadsheetData.model_validate(cached_data)
+        spreadsheet_data = self._read_spreadsheet(spreadsheet_id, cached_data) if cached_data else None
+        if spreadsheet_data:
+            if self._needs_refresh(spreadsheet_id):
+                self._schedule_refresh(spreadsheet_id, name or spreadsheet_data.name)
+        else:
+            # If not in cache, fetch from Google Sheets
+            spreadsheet_data = self._single_flight(
+                cache_key, lambda cached: self._read_spreadsheet(spreadsheet_id, cached),
+                lambda: self._load_spreadsheet(spreadsheet_id, name))
+
+        if spreadsheet_data:
+            self._attach_keyword_matcher(spreadsheet_id, spreadsheet_data.keywords)
+        return spreadsheet_data
+
+    def _load_spreadsheet(self, spreadsheet_id: str, name: str, refresh: bool = False) -> Optional[SpreadsheetData]:
+        """
+        Load a spreadsheet, reading from Google only the sheets that aren't cached, or all of them on `refresh`.
+        """
+        # Read before the sheets, so that an edit made while they load shows up as a newer version
+        version = self._get_drive_version(spreadsheet_id)
+        if refresh:
+            self._load_sheet_names(spreadsheet_id)
+        pq_sheet_names = self._matching_sheet_names(spreadsheet_id, 'pq')
+
+        # New Connections and every pq sheet are read with a single request
+        sheet_names = ['New Connections', *pq_sheet_names]
+        sheets = self._load_sheets_data(spreadsheet_id, sheet_names, 'A:ZZ') if refresh \
+            else self.get_sheets_data(spreadsheet_id, sheet_names)
+        new_connections_data = sheets.get('New Connections')
+        pq_sheet_names = [sheet_name for sheet_name in pq_sheet_names if sheet_name in sheets]
+
+        if refresh:
+            self.cache.delete(f"keywords:{spreadsheet_id}")
+        spreadsheet_data = self._compose_spreadsheet(spreadsheet_id, name, new_connections_data,
+                                                     [sheets[sheet_name] for sheet_name in pq_sheet_names])
+        if spreadsheet_data:
+            self._cache_spreadsheet_data(spreadsheet_data, pq_sheet_names, version)
+        return spreadsheet_data
+
+    def _read_spreadsheet(self, spreadsheet_id: str, cached_data: dict) -> Optional[SpreadsheetData]:
+        """
+        Compose a spreadsheet from its cached sheets, or return None if any of them is no longer cached.
 
-        # If not in cache, fetch from Google Sheets
-        new_connections_data = self.get_sheet_data(spreadsheet_id, 'New Connections', 'A:ZZ')
-        all_pq_sheets = self.get_all_sheets_that_match_name(spreadsheet_id, 'pq')
+        The composed spreadsheet, with its row indexes and keyword matcher, is kept in process and reused until
+        the spreadsheet is reloaded or one of its rows is updated.
+        """
+        # Read before the sheets, so that changes made while composing show up as a newer version
+        version = (self.get_cache_stamp(spreadsheet_id), self.cache.get(f"spreadsheet_revision:{spreadsheet_id}"))
+        composed = self._spreadsheets.get(spreadsheet_id)
+        if version[0] is not None and composed and composed[0] == version:
+            return composed[1]
+
+        new_connections_data = self._read_sheet(spreadsheet_id, 'New Connections')
+        pq_sheets = [self._read_sheet(spreadsheet_id, sheet_name) for sheet_name in cached_data['pq_sheet_names']]
+        if new_connections_data is None or None in pq_sheets:
+            return None
+
+        spreadsheet_data = self._compose_spreadsheet(spreadsheet_id, cached_data['name'], new_connections_data,
+                                                     pq_sheets)
+        if spreadsheet_data and version[0] is not None:
+            self._spreadsheets[spreadsheet_id] = (version, spreadsheet_data)
+        return spreadsheet_data
+
+    def _compose_spreadsheet(self, spreadsheet_id: str, name: str, new_connections_data: Optional[SheetData],
+                             all_pq_sheets: List[SheetData]) -> Optional[SpreadsheetData]:
         pq_data = SheetData(headers=all_pq_sheets[0].headers,
                             rows=[row for sheet in all_pq_sheets for row in sheet.rows]) if all_pq_sheets else None
         keywords = self._load_keywords(spreadsheet_id, pq_data)
 
         if new_connections_data:
-            spreadsheet_data = SpreadsheetData(
+            return SpreadsheetData(
                 id=spreadsheet_id,
                 name=name,
                 new_connections=new_connections_data,
                 pq_data=pq_data,
                 keywords=keywords,
             )
-            self._cache_spreadsheet_data(spreadsheet_data)
-            return spreadsheet_data
 
         return None
 
-    def get_sheet_data(self, spreadsheet_id: str, sheet_name: str, sheet_range: str) -> Optional[SheetData]:
-        cache_key = f"sheet_data:{spreadsheet_id}:{sheet_name}"
-        cached_data = self.cache.get(cache_key)
-        if cached_data:
-            return SheetData.model_validate(cached_data)
+    def _needs_refresh(self, spreadsheet_id: str) -> bool:
+        if self.cache.get(f"refresh_backoff:{spreadsheet_id}"):
+            return False
+
+        drive_version = self.cache.get(f"drive_version:{spreadsheet_id}")
+        if drive_version is None:
+            return not self.cache.get(f"spreadsheet_fresh:{spreadsheet_id}")
+        return drive_version != self.cache.get(f"spreadsheet_version:{spreadsheet_id}")
+
+    def _get_drive_version(self, spreadsheet_id: str) -> Optional[str]:
+        """
+        The current Drive version of a spreadsheet, as last seen by the folder poll or else asked from Drive.
+        """
+        version = self.cache.get(f"drive_version:{spreadsheet_id}")
+        if version is None:
+            version = get_file_version(spreadsheet_id)
+            if version is not None:
+                self.cache.set(f"drive_version:{spreadsheet_id}", version, expire=self.drive_version_expiry)
+        return version
 
-        sheet_data = fetch_sheet_data_from_google(spreadsheet_id, sheet_name, sheet_range)
+    def _run_folder_poll(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                with self._app.app_context():
+                    # The lock isn't released but expires just before the next poll is due, so that across workers
+                    # the folder is listed about once per interval, whatever the interval is
+                    poll_lock = self.cache.lock('drive_folder_poll', timeout=self.poll_interval * self.POLL_LOCK_SHARE,
+                                                blocking_timeout=0)
+                    if poll_lock.acquire():
+                        self.poll_folder()
+            except Exception as e:
+                logging.error(f"Error polling the Drive folder: {str(e)}")
+
+    def poll_folder(self) -> List[dict]:
+        """
+        List the Drive folder, record each spreadsheet's version and start reloading the cached spreadsheets
+        that were edited since they were loaded.
+
+        :return: The files in the folder
+        """
+        folder_id = current_app.config['GOOGLE_DRIVE_FOLDER_ID']
+        files = list_files_in_folder(folder_id)
+        self.cache.set(f"drive_files:{folder_id}", files, expire=self.drive_version_expiry)
+        for file in files:
+            self.cache.set(f"drive_version:{file['id']}", file.get('version'), expire=self.drive_version_expiry)
+            if self.cache.get(f"spreadsheet:{file['id']}") and self._needs_refresh(file['id']):
+                self._schedule_refresh(file['id'], file['name'])
+        return files
+
+    def _schedule_refresh(self, spreadsheet_id: str, name: str):
+        with self._refreshing_guard:
+            if spreadsheet_id in self._refreshing:
+                return
+            self._refreshing.add(spreadsheet_id)
+        self._refresh_executor.submit(self._refresh_spreadsheet, current_app._get_current_object(), spreadsheet_id,
+                                      name)
+
+    def _refresh_spreadsheet(self, app, spreadsheet_id: str, name: str):
+        """
+        Reload a stale spreadsheet from Google while readers keep getting the cached copy. Only one worker
+        refreshes a given spreadsheet at a time; the others skip it.
+        """
+        try:
+            with app.app_context():
+                refresh_lock = self.cache.lock(f"refresh:{spreadsheet_id}", timeout=self.LOAD_LOCK_TIMEOUT,
+                                               blocking_timeout=0)
+                if not refresh_lock.acquire():
+                    return
+                try:
+                    # Another worker may have reloaded it meanwhile, or without a known version it may be unchanged
+                    self._get_drive_version(spreadsheet_id)
+                    if not self._needs_refresh(spreadsheet_id):
+                        return
+                    # Cached sheets are overwritten in place, so readers never see them missing
+                    if not self._load_spreadsheet(spreadsheet_id, name, refresh=True):
+                        raise ValueError("no 'New Connections' data returned")
+                finally:
+                    refresh_lock.release()
+        except Exception as e:
+            logging.error(f"Error refreshing spreadsheet {spreadsheet_id}: {str(e)}")
+            # Keep serving the stale copy for a while instead of retrying on every request
+            self.cache.set(f"refresh_backoff:{spreadsheet_id}", True, expire=self.REFRESH_RETRY_DELAY)
+        finally:
+            with self._refreshing_guard:
+                self._refreshing.discard(spreadsheet_id)
+
+    def get_sheet_data(self, spreadsheet_id: str, sheet_name: str, sheet_range: str) -> Optional[SheetData]:
+        sheet_data = self._read_sheet(spreadsheet_id, sheet_name)
         if sheet_data:
+            return sheet_data
+
+        return self._single_flight(
+            f"sheet_meta:{spreadsheet_id}:{sheet_name}",
+            lambda cached: self._read_sheet(spreadsheet_id, sheet_name, cached),
+            lambda: self._load_sheets_data(spreadsheet_id, [sheet_name], sheet_range).get(sheet_name))
+
+    def get_sheets_data(self, spreadsheet_id: str, sheet_names: List[str],
+                        sheet_range: str = 'A:ZZ') -> Dict[str, SheetData]:
+        """
+        Get several sheets of a spreadsheet, reading the ones that aren't cached with a single request.
+
+        :return: The data of each sheet that exists and isn't empty, by sheet name
+        """
+        result = {}
+        missing_sheet_names = []
+        for sheet_name in sheet_names:
+            sheet_data = self._read_sheet(spreadsheet_id, sheet_name)
+            if sheet_data:
+                result[sheet_name] = sheet_data
+            else:
+                missing_sheet_names.append(sheet_name)
+
+        if missing_sheet_names:
+            result.update(self._load_sheets_data(spreadsheet_id, missing_sheet_names, sheet_range))
+        return result
+
+    def _load_sheets_data(self, spreadsheet_id: str, sheet_names: List[str],
+                          sheet_range: str) -> Dict[str, SheetData]:
+        existing_sheet_names = set(self.get_sheet_names(spreadsheet_id))
+        sheet_names = [sheet_name for sheet_name in sheet_names if sheet_name in existing_sheet_names]
+
+        # Saved rows that aren't written to the sheet yet keep their saved values. Taken both before and after
+        # the read, so that updates written meanwhile are kept too.
+        write_queue = SheetWriteQueue.get_instance()
+        unwritten_updates = write_queue.get_unwritten_updates(spreadsheet_id)
+        sheets_data = fetch_sheets_data_from_google(spreadsheet_id, sheet_names, sheet_range)
+        for row, updates in write_queue.get_unwritten_updates(spreadsheet_id).items():
+            unwritten_updates.setdefault(row, {}).update(updates)
+
+        result = {}
+        for sheet_name, sheet_data in sheets_data.items():
+            if not sheet_data:
+                continue
             sheet_data_model = SheetData.from_list(sheet_data)
+            for (updated_sheet_name, row_number), updates in unwritten_updates.items():
+                if updated_sheet_name == sheet_name:
+                    # Cached rows are numbered from the first row after the header
+                    sheet_data_model.update_row(row_number - 1, updates)
             if sheet_name == 'New Connections':
-                colored_cells = fetch_colored_cells_from_google(spreadsheet_id, sheet_name)
-                sheet_data_model.colored_cells = colored_cells
-            self.cache.set(cache_key, sheet_data_model.model_dump(), expire=self.CACHE_EXPIRY)
-            return sheet_data_model
+                sheet_data_model.colored_cells = self._get_colored_cells(spreadsheet_id, sheet_name,
+                                                                         sheet_data_model.headers)
+            self._store_sheet(spreadsheet_id, sheet_name, sheet_data_model)
+            result[sheet_name] = sheet_data_model
 
-        return None
+        return result
 
-    def get_all_sheets_that_match_name(self, spreadsheet_id: str, sheet_name: str) -> List[SheetData]:
+    def _read_sheet(self, spreadsheet_id: str, sheet_name: str, meta: dict = None) -> Optional[SheetData]:
+        """
+        Build a sheet from the cache: its rows from the `sheet_rows` hash and its headers and colours from
+        `sheet_meta`. Returns None if the sheet, or any of its rows, is no longer cached.
+        """
+        meta = meta or self.cache.get(f"sheet_meta:{spreadsheet_id}:{sheet_name}")
+        if not meta:
+            return None
+
+        rows = self.cache.hgetall(f"sheet_rows:{spreadsheet_id}:{sheet_name}") if meta['row_count'] else {}
+        if len(rows) != meta['row_count']:
+            return None
+
+        # Cached values are shared, so rows get their own copy of the data
+        return SheetData.model_construct(
+            headers=list(meta['headers']),
+            rows=[SheetRow.model_construct(row_number=int(row_number), data=dict(data))
+                  for row_number, data in sorted(rows.items(), key=lambda item: int(item[0]))],
+            colored_cells=list(meta['colored_cells']),
+        )
+
+    def _store_sheet(self, spreadsheet_id: str, sheet_name: str, sheet_data: SheetData):
+        meta_key = f"sheet_meta:{spreadsheet_id}:{sheet_name}"
+        cached_meta = self.cache.get(meta_key)
+        if not cached_meta or cached_meta['headers'] != sheet_data.headers:
+            # The write queue maps columns by the cached header row, which may have changed as well
+            self.cache.delete(f"sheet_header:{spreadsheet_id}:{sheet_name}")
+
+        self.cache.hset_many(f"sheet_rows:{spreadsheet_id}:{sheet_name}",
+                             {row.row_number: row.data for row in sheet_data.rows},
+                             expire=self.CACHE_EXPIRY, replace=True)
+        self.cache.set(meta_key, {
+            'headers': sheet_data.headers,
+            'colored_cells': sheet_data.colored_cells,
+            'row_count': len(sheet_data.rows),
+        }, expire=self.CACHE_EXPIRY)
+
+    def _get_colored_cells(self, spreadsheet_id: str, sheet_name: str, headers: List[str]) -> List[str]:
+        """
+        Get the coloured header cells of a sheet, reusing the cached ones while the header row stays the same.
+
+        Edits to the rows, including this app's own saves, change the spreadsheet's Drive version but not its
+        header row, so they don't cost another read of the formatting.
+        """
+        cache_key = f"colored_cells:{spreadsheet_id}:{sheet_name}"
+        header_hash = hashlib.sha256(orjson.dumps(headers)).hexdigest()
+        cached = self.cache.get(cache_key)
+        if cached and cached.get('header_hash') == header_hash:
+            return cached['colored_cells']
+
+        # The headers include the added row_number column
+        colored_cells = fetch_colored_cells_from_google(spreadsheet_id, sheet_name, len(headers) - 1,
+                                                        check_exists=False) or []
+        self.cache.set(cache_key, {'header_hash': header_hash, 'colored_cells': colored_cells},
+                       expire=self.COLORED_CELLS_EXPIRY)
+        return colored_cells
+
+    def get_sheet_names(self, spreadsheet_id: str) -> List[str]:
+        """
+        Names of the sheets of a spreadsheet, from its metadata, which is fetched once and cached.
+        """
         cache_key = f"spreadsheet_sheets:{spreadsheet_id}"
 
         # Try to get the list of sheet names from cache
@@ -75,37 +361,69 @@ class SpreadsheetService:
 
         if not all_sheets:
             # If not in cache, fetch from Google Sheets
-            all_sheets = fetch_sheet_names_from_google(spreadsheet_id)
-            # Cache the list of sheet names
-            self.cache.set(cache_key, all_sheets, expire=self.CACHE_EXPIRY)
-
-        matching_sheets = [name for name in all_sheets if sheet_name.lower().strip() in name.lower().strip()]
-        result = []
-        for name in matching_sheets:
-            sheet_data = self.get_sheet_data(spreadsheet_id, name, 'A:ZZ')
-            if sheet_data:
-                result.append(sheet_data)
+            all_sheets = self._single_flight(cache_key, list,
+                                             lambda: self._load_sheet_names(spreadsheet_id)) or []
+        return all_sheets
 
-        return result
+    def get_all_sheets_that_match_name(self, spreadsheet_id: str, sheet_name: str) -> List[SheetData]:
+        matching_sheets = self._matching_sheet_names(spreadsheet_id, sheet_name)
+        sheets = self.get_sheets_data(spreadsheet_id, matching_sheets)
+        return [sheets[name] for name in matching_sheets if name in sheets]
+
+    def _matching_sheet_names(self, spreadsheet_id: str, sheet_name: str) -> List[str]:
+        return [name for name in self.get_sheet_names(spreadsheet_id)
+                if sheet_name.lower().strip() in name.lower().strip()]
+
+    def _load_sheet_names(self, spreadsheet_id: str) -> List[str]:
+        all_sheets = fetch_sheet_names_from_google(spreadsheet_id)
+        # Cache the list of sheet names
+        self.cache.set(f"spreadsheet_sheets:{spreadsheet_id}", all_sheets, expire=self.CACHE_EXPIRY)
+        return all_sheets
 
     def update_row(self, spreadsheet_id: str, sheet_name: str, row_number: int, new_data: dict):
-        update_sheet_rows(spreadsheet_id, sheet_name, row_number, new_data)
-        self._update_sheet_row_cache(spreadsheet_id, sheet_name, row_number, new_data)
+        """
+        Update a row of a sheet. The cache is updated right away, the sheet itself shortly after.
+
+        :param row_number: The row number in the sheet, counting the header row
+        """
+        SheetWriteQueue.get_instance().enqueue(spreadsheet_id, sheet_name, row_number, new_data)
+        # Cached rows are numbered from the first row after the header
+        self._update_sheet_row_cache(spreadsheet_id, sheet_name, row_number - 1, new_data)
 
     def get_all_spreadsheets_in_drive(self) -> List[SpreadsheetData]:
-        all_files = list_files_in_folder(current_app.config['GOOGLE_DRIVE_FOLDER_ID'])
-        return [self.get_spreadsheet(file['id'], file['name']) for file in all_files if
-                self.get_spreadsheet(file['id'], file['name'])]
+        # The listing of the last folder poll is recent enough
+        all_files = self.cache.get(f"drive_files:{current_app.config['GOOGLE_DRIVE_FOLDER_ID']}") or self.poll_folder()
+        spreadsheets = [self.get_spreadsheet(file['id'], file['name']) for file in all_files]
+        return [spreadsheet for spreadsheet in spreadsheets if spreadsheet]
 
     def _load_keywords(self, spreadsheet_id: str, pq_data: Optional[SheetData]) -> PqKeywords:
         cache_key = f"keywords:{spreadsheet_id}"
         cached_keywords = self.cache.get(cache_key)
         if cached_keywords:
-            return PqKeywords.model_validate(cached_keywords)
+            keywords = PqKeywords.model_validate(cached_keywords)
+        elif not pq_data:
+            keywords = PqKeywords(titles=[], seniority=[], negative_keywords=[])
+        else:
+            keywords = self._single_flight(cache_key, PqKeywords.model_validate,
+                                           lambda: self._extract_keywords(spreadsheet_id, pq_data))
 
-        if not pq_data:
-            return PqKeywords(titles=[], seniority=[], negative_keywords=[])
+        self._attach_keyword_matcher(spreadsheet_id, keywords)
+        return keywords
 
+    def _attach_keyword_matcher(self, spreadsheet_id: str, keywords: PqKeywords):
+        """
+        Give the keywords the compiled matcher of their spreadsheet, compiling it only when the keywords changed.
+        """
+        fingerprint = (tuple(keywords.titles), tuple(keywords.seniority), tuple(keywords.negative_keywords))
+        cached = self._keyword_matchers.get(spreadsheet_id)
+        if cached and cached[0] == fingerprint:
+            keywords.set_matcher(cached[1])
+            return
+
+        matcher = keywords.get_matcher()
+        self._keyword_matchers[spreadsheet_id] = (fingerprint, matcher)
+
+    def _extract_keywords(self, spreadsheet_id: str, pq_data: SheetData) -> PqKeywords:
         titles = []
         seniorities = []
         negative_keywords = []
@@ -122,23 +440,71 @@ class SpreadsheetService:
                 negative_keywords.append(negative)
 
         keywords = PqKeywords(titles=titles, seniority=seniorities, negative_keywords=negative_keywords)
-        self.cache.set(cache_key, keywords.model_dump(), expire=self.CACHE_EXPIRY)
+        self.cache.set(f"keywords:{spreadsheet_id}", keywords.model_dump(), expire=self.CACHE_EXPIRY)
         return keywords
 
-    def _cache_spreadsheet_data(self, spreadsheet_data: SpreadsheetData):
+    def _single_flight(self, cache_key: str, from_cache: Callable[[Any], Any], loader: Callable[[], Any]) -> Any:
+        """
+        Run `loader` for a cache miss at most once at a time per key, within this process and across workers.
+
+        Callers that had to wait re-check the cache once the lock is theirs and reuse whatever the previous
+        holder stored there. If the shared lock cannot be taken in time, the loader runs anyway.
+
+        :param cache_key: The cache key being loaded
+        :param from_cache: Converts a cached value into the value to return, or None if it is incomplete
+        :param loader: Fetches the value, stores it in the cache and returns it
+        """
+        with self._load_locks_guard:
+            local_lock = self._load_locks.setdefault(cache_key, threading.Lock())
+
+        with local_lock:
+            cached_data = self.cache.get(cache_key)
+            value = from_cache(cached_data) if cached_data else None
+            if value is not None:
+                return value
+
+            try:
+                shared_lock = self.cache.lock(cache_key, timeout=self.LOAD_LOCK_TIMEOUT,
+                                              blocking_timeout=self.LOAD_LOCK_TIMEOUT)
+                acquired = shared_lock.acquire()
+            except Exception as e:
+                logging.error(f"Error acquiring load lock for {cache_key}: {str(e)}")
+                return loader()
+
+            try:
+                if acquired:
+                    cached_data = self.cache.get(cache_key)
+                    value = from_cache(cached_data) if cached_data else None
+                    if value is not None:
+                        return value
+                return loader()
+            finally:
+                if acquired:
+                    try:
+                        shared_lock.release()
+                    except Exception as e:
+                        logging.warning(f"Error releasing load lock for {cache_key}: {str(e)}")
+
+    def get_cache_stamp(self, spreadsheet_id: str) -> Optional[str]:
+        """
+        Cheap marker that changes whenever the cached spreadsheet is rebuilt, and disappears with it.
+        """
+        return self.cache.get(f"spreadsheet_stamp:{spreadsheet_id}")
+
+    def _cache_spreadsheet_data(self, spreadsheet_data: SpreadsheetData, pq_sheet_names: List[str],
+                                version: Optional[str]):
+        # The sheets themselves are already cached; this records which ones make up the spreadsheet
         cache_key = f"spreadsheet:{spreadsheet_data.id}"
-        self.cache.set(cache_key, spreadsheet_data.model_dump(), expire=self.CACHE_EXPIRY)
+        self.cache.set(cache_key, {'name': spreadsheet_data.name, 'pq_sheet_names': pq_sheet_names},
+                       expire=self.CACHE_EXPIRY)
+        self.cache.set(f"spreadsheet_stamp:{spreadsheet_data.id}", uuid4().hex, expire=self.CACHE_EXPIRY)
+        self.cache.set(f"spreadsheet_version:{spreadsheet_data.id}", version, expire=self.CACHE_EXPIRY)
+        self.cache.set(f"spreadsheet_fresh:{spreadsheet_data.id}", True, expire=self.CACHE_SOFT_TTL)
 
     def _update_sheet_row_cache(self, spreadsheet_id: str, sheet_name: str, row_number: int, new_data: dict):
-        cache_key = f"sheet_data:{spreadsheet_id}:{sheet_name}"
-        cached_data = self.cache.get(cache_key)
-        if cached_data:
-            sheet_data = SheetData.model_validate(cached_data)
-            for row in sheet_data.rows:
-                if row.row_number == row_number:
-                    row.update(new_data)
-                    break
-            self.cache.set(cache_key, sheet_data.model_dump(), expire=self.CACHE_EXPIRY)
+        if self.cache.hmerge(f"sheet_rows:{spreadsheet_id}:{sheet_name}", row_number, new_data) is not None:
+            # Spreadsheets composed from the old row are composed again
+            self.cache.set(f"spreadsheet_revision:{spreadsheet_id}", uuid4().hex, expire=self.CACHE_EXPIRY)
 
     @staticmethod
     def calculate_unprocessed_rows_in_sheet(sheet: SheetData) -> List[SheetRow]:
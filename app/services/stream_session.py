@@ -0,0 +1,145 @@
+# app/services/stream_session.py
+
+from typing import List, Optional, Set, Iterable, Tuple
+from uuid import uuid4
+
+import orjson
+from flask import current_app
+
+from app.utils.redis_cache import RedisCache
+
+
+class StreamSession:
+    """
+    Server-side state of one /process_stream session, kept in Redis so that a reconnecting EventSource resumes
+    where it left off instead of starting over.
+
+    Events get ids `{session_id}:{seq}` and the last STREAM_REPLAY_BUFFER_SIZE of them are kept for replay. The
+    rows handed out per spreadsheet are recorded together with the event that carried them, so a resumed session
+    never serves them again. Only the connection that claimed the session last may keep serving it.
+    """
+
+    def __init__(self, session_id: str, spreadsheet_ids: List[str], small_batch_size: int, large_batch_size: int):
+        self.session_id = session_id
+        self.spreadsheet_ids = spreadsheet_ids
+        self.small_batch_size = small_batch_size
+        self.large_batch_size = large_batch_size
+        self.redis = RedisCache.get_instance().redis
+        self.ttl = current_app.config['STREAM_SESSION_TTL']
+        self.buffer_size = current_app.config['STREAM_REPLAY_BUFFER_SIZE']
+        self.owner = uuid4().hex
+        self._key = f"stream_session:{session_id}"
+
+    @classmethod
+    def create(cls, spreadsheet_ids: List[str], small_batch_size: int, large_batch_size: int) -> 'StreamSession':
+        session = cls(uuid4().hex, spreadsheet_ids, small_batch_size, large_batch_size)
+        session.redis.hset(session._key, mapping={
+            'params': orjson.dumps([spreadsheet_ids, small_batch_size, large_batch_size]),
+            'seq': 0,
+            'since_pause': 0,
+            'paused': 0,
+        })
+        session.claim()
+        return session
+
+    @classmethod
+    def resume(cls, session_id: str) -> Optional['StreamSession']:
+        """
+        Load an existing session and claim it for the current connection.
+
+        :param session_id: The session part of the last event id the client received
+        :return: The session, or None if it is unknown or expired
+        """
+        params = RedisCache.get_instance().redis.hget(f"stream_session:{session_id}", 'params')
+        if not params:
+            return None
+        spreadsheet_ids, small_batch_size, large_batch_size = orjson.loads(params)
+        session = cls(session_id, spreadsheet_ids, small_batch_size, large_batch_size)
+        session.claim()
+        return session
+
+    @staticmethod
+    def parse_event_id(event_id: str) -> Optional[Tuple[str, int]]:
+        session_id, _, seq = event_id.partition(':')
+        return (session_id, int(seq)) if session_id and seq.isdigit() else None
+
+    def claim(self):
+        self.redis.hset(self._key, 'owner', self.owner)
+        self.redis.expire(self._key, self.ttl)
+
+    def is_owner(self) -> bool:
+        owner = self.redis.hget(self._key, 'owner')
+        return owner is not None and owner.decode('utf-8') == self.owner
+
+    def is_complete(self) -> bool:
+        return bool(self.redis.hget(self._key, 'complete'))
+
+    def contacts_since_pause(self) -> int:
+        return int(self.redis.hget(self._key, 'since_pause') or 0)
+
+    def is_paused(self) -> bool:
+        return bool(int(self.redis.hget(self._key, 'paused') or 0))
+
+    def end_pause(self):
+        self.redis.hset(self._key, mapping={'since_pause': 0, 'paused': 0})
+
+    def processed_row_numbers(self, spreadsheet_id: str) -> Set[int]:
+        return {int(row_number) for row_number in self.redis.smembers(self._rows_key(spreadsheet_id))}
+
+    def events_after(self, seq: int) -> List[str]:
+        """
+        The buffered events the client hasn't received yet, oldest first.
+        """
+        events = [orjson.loads(entry) for entry in self.redis.lrange(f"{self._key}:events", 0, -1)]
+        missed = [message for event_seq, message in events if event_seq > seq]
+        if events and events[0][0] > seq + 1:
+            current_app.logger.warning(f"Stream session {self.session_id} lost events after {seq} from its buffer")
+        return missed
+
+    def send(self, payload: str, spreadsheet_id: str = None, row_numbers: Iterable[int] = (),
+             contacts_since_pause: int = None, pause: bool = False, complete: bool = False) -> str:
+        """
+        Number an event, buffer it for replay and record the rows it carries, all at once.
+
+        :param payload: The JSON data of the event
+        :param spreadsheet_id: The spreadsheet whose rows the event carries
+        :param row_numbers: The rows the event carries
+        :param contacts_since_pause: Contacts sent since the reviewer last continued, including this event's
+        :param pause: Whether the event asks the reviewer to continue
+        :param complete: Whether this is the last event of the session
+        :return: The event formatted for the event stream
+        """
+        seq = self.redis.hincrby(self._key, 'seq', 1)
+        message = f"id: {self.session_id}:{seq}\ndata: {payload}\n\n"
+
+        pipeline = self.redis.pipeline()
+        pipeline.rpush(f"{self._key}:events", orjson.dumps([seq, message]))
+        pipeline.ltrim(f"{self._key}:events", -self.buffer_size, -1)
+        pipeline.expire(f"{self._key}:events", self.ttl)
+        self._record_rows(pipeline, spreadsheet_id, row_numbers)
+        if contacts_since_pause is not None:
+            pipeline.hset(self._key, 'since_pause', contacts_since_pause)
+        if pause:
+            pipeline.hset(self._key, 'paused', 1)
+        if complete:
+            pipeline.hset(self._key, 'complete', 1)
+        pipeline.expire(self._key, self.ttl)
+        pipeline.execute()
+        return message
+
+    def mark_processed(self, spreadsheet_id: str, row_numbers: Iterable[int]):
+        """
+        Record rows that were consumed without producing an event, e.g. because enriching them failed.
+        """
+        pipeline = self.redis.pipeline()
+        self._record_rows(pipeline, spreadsheet_id, row_numbers)
+        pipeline.execute()
+
+    def _record_rows(self, pipeline, spreadsheet_id: Optional[str], row_numbers: Iterable[int]):
+        row_numbers = list(row_numbers)
+        if spreadsheet_id and row_numbers:
+            pipeline.sadd(self._rows_key(spreadsheet_id), *row_numbers)
+            pipeline.expire(self._rows_key(spreadsheet_id), self.ttl)
+
+    def _rows_key(self, spreadsheet_id: str) -> str:
+        return f"{self._key}:rows:{spreadsheet_id}"
@@ -12,6 +12,7 @@ document.addEventListener("alpine:init", () => {
       sheets: window.initialSheets || [], // Use the global variable
       awaitingUserAction: false,
       processingPaused: false,
+      showAllExperiences: false,
 
       get totalCount() {
          if (this._totalCount === -1) this._totalCount = this.sheets.filter(sheet => this.selectedSheetIds.includes(sheet.id)).reduce((total, sheet) => total + sheet.empty_by_the_way_count, 0);
@@ -67,6 +68,11 @@ document.addEventListener("alpine:init", () => {
          };
 
          this.eventSource.onerror = (error) => {
+            // While the connection is being re-established the browser resumes the stream with Last-Event-ID
+            if (this.eventSource.readyState === EventSource.CONNECTING) {
+               console.warn("EventSource reconnecting:", error);
+               return;
+            }
             console.error("EventSource failed:", error);
             this.eventSource.close();
             this.isLoading = false;
@@ -207,6 +213,23 @@ document.addEventListener("alpine:init", () => {
          };
       },
 
+      async loadDetails() {
+         const entry = this.currentEntry;
+         if (!entry || entry.details) return;
+
+         try {
+            const response = await fetch(`/contact/${encodeURIComponent(entry.linkedin_username)}`);
+            if (response.ok) entry.details = await response.json();
+         } catch (error) {
+            console.error("Error loading contact details:", error);
+         }
+      },
+
+      get allExperiences() {
+         const experiences = this.currentEntry?.details?.nubela_response?.experiences || [];
+         return experiences.filter(exp => exp.starts_at).map(exp => this.formatExperience(exp));
+      },
+
       get relevantExperiences() {
          if (!this.currentEntry || !this.currentEntry.relevant_experiences) {
             return [];
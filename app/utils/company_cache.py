@@ -0,0 +1,47 @@
+# app/utils/company_cache.py
+
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from flask import current_app
+
+from app.utils.redis_cache import RedisCache
+
+
+def normalize_domain(website: str) -> str:
+    """
+    Reduce a website to its bare domain, e.g. 'https://www.Acme.com/about/' -> 'acme.com'.
+    """
+    website = website.strip().lower()
+    if '://' not in website:
+        website = f'//{website}'
+    domain = urlparse(website).hostname or ''
+    return domain[4:] if domain.startswith('www.') else domain
+
+
+class CompanyEnrichmentCache:
+    """
+    About and case study links per company, shared by every contact and spreadsheet that mentions the company.
+    """
+
+    _instance = None
+
+    def __init__(self):
+        self.cache = RedisCache.get_instance()
+        self.ttl = current_app.config['COMPANY_CACHE_TTL']
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def get(self, website: str) -> Optional[Dict[str, List[dict]]]:
+        domain = normalize_domain(website)
+        return self.cache.get(f"company_links:{domain}") if domain else None
+
+    def set(self, website: str, about_links: List[dict], case_study_links: List[dict]):
+        domain = normalize_domain(website)
+        if domain:
+            self.cache.set(f"company_links:{domain}",
+                           {'about_links': about_links, 'case_study_links': case_study_links}, expire=self.ttl)
@@ -11,15 +11,29 @@ from datetime import datetime, timedelta, timezone
 from jiter.jiter import from_json
 import orjson
 
-from app.models.nubela_response_models import NubelaResponse
+from app.models.nubela_response_models import LazyNubelaResponse
+from app.utils.http_client import HttpClient
 from app.utils.image_manager import ImageManager
+from app.utils.nubela_cache import NubelaProfileCache
+from app.utils.rate_governor import RateLimitExceeded, throttle
 from app.models import ContactData, CompanyData
 from typing import List, Dict, Optional, Union, Any
 
 
-def perform_google_search(search_query: str, search_type: str, username: str, max_results: int = 5) -> Dict:
+def perform_google_searches(search_queries: List[str], max_results: int = 10) -> Dict[str, Dict]:
+    """
+    Runs many Google searches in a single Apify actor run.
+
+    :param search_queries: The queries to run; duplicates are searched once
+    :param max_results: Results per page for every query
+    :return: The dataset item of each query, keyed by the query
+    """
+    unique_queries = list(dict.fromkeys(query for query in search_queries if query))
+    if not unique_queries:
+        return {}
+
     run_input = {
-        "queries": search_query,
+        "queries": "\n".join(unique_queries),
         "resultsPerPage": max_results,
         "maxPagesPerQuery": 1,
         "languageCode": "",
@@ -30,30 +44,60 @@ def perform_google_search(search_query: str, search_type: str, username: str, ma
         "includeIcons": False,
     }
 
+    throttle('apify')
     run = current_app.config['APIFY_CLIENT'].actor("nFJndFXA5zjCTuudP").call(run_input=run_input)
 
     results = {}
     for item in current_app.config['APIFY_CLIENT'].dataset(run["defaultDatasetId"]).iterate_items():
-        results = item
+        query = item.get('searchQuery', {}).get('term')
+        if query is None and len(unique_queries) == 1:
+            query = unique_queries[0]
+        if query is not None:
+            results[query] = item
 
     return results
 
 
-def search_company_about_page(company_website: str, contact_info: ContactData) -> Optional[List[Dict]]:
+def perform_google_search(search_query: str, search_type: str, username: str, max_results: int = 5) -> Dict:
+    return perform_google_searches([search_query], max_results).get(search_query, {})
+
+
+def company_about_page_query(company_website: str) -> str:
+    return f"site:{company_website} AND inurl:about -inurl:blog -inurl:support -inurl:article -inurl:articles"
+
+
+def company_case_studies_query(company_website: str) -> str:
+    return f"site:{company_website} AND (case study OR testimonial OR projects OR reviews OR award)"
+
+
+def person_interviews_podcasts_query(name: str, company_name: str) -> str:
+    one_year_ago = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+    return f'"{name}" AND "{company_name}" AND ("Interview" OR "podcast" OR "guest") after:{one_year_ago}'
+
+
+def search_company_about_page(company_website: str, contact_info: ContactData,
+                              search_results: Optional[Dict[str, Dict]] = None) -> Optional[List[Dict]]:
     """Searches for the About Us page of a company website"""
-    search_query = f"site:{company_website} AND inurl:about -inurl:blog -inurl:support -inurl:article -inurl:articles"
-    results = perform_google_search(search_query, "company_about", contact_info.linkedin_username)
+    search_query = company_about_page_query(company_website)
+    if search_results is not None:
+        results = search_results.get(search_query)
+    else:
+        results = perform_google_search(search_query, "company_about", contact_info.linkedin_username)
 
     if not results or 'organicResults' not in results:
         return None
 
-    return results['organicResults']
+    return results['organicResults'][:5]
 
 
-def search_company_case_studies(company_website: str, username: str) -> List[Dict]:
+def search_company_case_studies(company_website: str, username: str,
+                                search_results: Optional[Dict[str, Dict]] = None) -> List[Dict]:
     """Search for case studies, testimonials, projects, reviews, or awards related to a company."""
-    search_query = f"site:{company_website} AND (case study OR testimonial OR projects OR reviews OR award)"
-    results = perform_google_search(search_query, "company_case_studies", username, max_results=10)
+    search_query = company_case_studies_query(company_website)
+    if search_results is not None:
+        results = search_results.get(search_query)
+    else:
+        results = perform_google_search(search_query, "company_case_studies", username, max_results=10)
 
     if not results or 'organicResults' not in results:
         return []
@@ -64,17 +108,20 @@ def search_company_case_studies(company_website: str, username: str) -> List[Dic
             'title': result['title'],
             'description': result.get('description', '')
         }
-        for result in results['organicResults']
+        for result in results['organicResults'][:10]
     ]
 
 
-def search_person_interviews_podcasts(name: str, company_name: str, username: str, max_results: int = 10) -> List[Dict]:
+def search_person_interviews_podcasts(name: str, company_name: str, username: str, max_results: int = 10,
+                                      search_results: Optional[Dict[str, Dict]] = None) -> List[Dict]:
     """
     Searches for interviews, podcasts, and articles featuring a person from a specific company.
     """
-    one_year_ago = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
-    search_query = f'"{name}" AND "{company_name}" AND ("Interview" OR "podcast" OR "guest") after:{one_year_ago}'
-    results = perform_google_search(search_query, "person_media", username, max_results)
+    search_query = person_interviews_podcasts_query(name, company_name)
+    if search_results is not None:
+        results = search_results.get(search_query)
+    else:
+        results = perform_google_search(search_query, "person_media", username, max_results)
 
     if not results or 'organicResults' not in results:
         return []
@@ -142,34 +189,47 @@ def get_nubela_data_for_contact(linkedin_profile_url: str) -> Optional[Union[Dic
     LINKEDIN_USERNAME = linkedin_profile_url.split('/')[-2] if linkedin_profile_url.endswith('/') else \
         linkedin_profile_url.split('/')[-1]
 
-    params = {
-        "linkedin_profile_url": linkedin_profile_url,
-        "extra": "include"
-    }
-
-    # If not, fetch from API
-    response = requests.get(API_ENDPOINT, params=params, headers={
-        'Authorization': f'Bearer {current_app.config["NUBELA_API_KEY"]}'
-    })
-
-    if response.status_code == 200:
-        data = response.json()
-
-        image_manager = ImageManager.get_instance()
-
-        local_profile_pic_url = image_manager.get_or_download_image(
-            data.get('profile_pic_url'), LINKEDIN_USERNAME, 'profile')
-        local_banner_pic_url = image_manager.get_or_download_image(
-            data.get('background_cover_image_url'), LINKEDIN_USERNAME, 'banner')
+    profile_cache = NubelaProfileCache.get_instance()
+    raw_response = profile_cache.get(LINKEDIN_USERNAME)
 
-        # Convert the dictionary to JSON string, then to Pydantic model
-        nubela_response = NubelaResponse.model_validate_json(orjson.dumps(data))
-
-        return {
-            "nubela_response": nubela_response,
-            "local_profile_pic_url": local_profile_pic_url,
-            "local_banner_pic_url": local_banner_pic_url,
+    if raw_response is None:
+        params = {
+            "linkedin_profile_url": linkedin_profile_url,
+            "extra": "include"
         }
-    else:
-        logging.error(f"Failed to fetch Nubela data for {linkedin_profile_url}: {response.status_code}")
-        return None
+
+        # If not, fetch from API
+        try:
+            response = HttpClient.get_instance().get(API_ENDPOINT, rate_limit='nubela', params=params, headers={
+                'Authorization': f'Bearer {current_app.config["NUBELA_API_KEY"]}'
+            })
+            status = response.status_code
+        except (requests.RequestException, RateLimitExceeded) as e:
+            response, status = None, str(e)
+
+        if response is not None and response.status_code == 200:
+            raw_response = response.content
+            profile_cache.set(LINKEDIN_USERNAME, raw_response)
+        else:
+            logging.error(f"Failed to fetch Nubela data for {linkedin_profile_url}: {status}")
+            # Fall back to an outdated profile rather than none at all
+            raw_response = profile_cache.get(LINKEDIN_USERNAME, allow_stale=True)
+            if raw_response is None:
+                return None
+
+    data = orjson.loads(raw_response)
+
+    local_images = ImageManager.get_instance().get_or_download_images({
+        'profile': data.get('profile_pic_url'),
+        'banner': data.get('background_cover_image_url'),
+    }, LINKEDIN_USERNAME)
+    local_profile_pic_url = local_images['profile']
+    local_banner_pic_url = local_images['banner']
+
+    nubela_response = LazyNubelaResponse(data)
+
+    return {
+        "nubela_response": nubela_response,
+        "local_profile_pic_url": local_profile_pic_url,
+        "local_banner_pic_url": local_banner_pic_url,
+    }
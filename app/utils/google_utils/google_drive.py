@@ -1,11 +1,30 @@
+import logging
+
 from app.utils.google_utils.google_auth import GoogleService
 
 
 def list_files_in_folder(folder_id):
+    """
+    List the spreadsheets in a folder with their id, name, modifiedTime and version. The version is a number, as a
+    string, that increases with every change to the file.
+    """
     service = GoogleService.get_instance().get_service('drive', 'v3')
 
     results = service.files().list(
         q=f"'{folder_id}' in parents and mimeType='application/vnd.google-apps.spreadsheet'",
-        fields="files(id, name)").execute()
+        fields="files(id, name, modifiedTime, version)").execute()
 
     return results.get('files', [])
+
+
+def get_file_version(file_id):
+    """
+    Get the version of a file, which increases with every change to it, or None if it can't be read.
+    """
+    service = GoogleService.get_instance().get_service('drive', 'v3')
+
+    try:
+        return service.files().get(fileId=file_id, fields="version").execute().get('version')
+    except Exception as e:
+        logging.error(f"Error getting the version of {file_id}: {str(e)}")
+        return None
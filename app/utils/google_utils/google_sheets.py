@@ -1,55 +1,61 @@
 from app.utils.google_utils.google_auth import GoogleService
+from app.utils.rate_governor import RateLimitExceeded, throttle
 
 
 def fetch_sheet_names_from_google(spreadsheet_id):
     service = GoogleService.get_instance().get_service('sheets', 'v4')
 
     try:
+        throttle('sheets_read')
         sheet_metadata = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
         sheets = sheet_metadata.get('sheets', '')
         return [sheet['properties']['title'] for sheet in sheets]
+    except RateLimitExceeded:
+        raise
     except Exception as e:
         return []
 
 
-def fetch_colored_cells_from_google(spreadsheet_id, sheet_name, range_name='A:ZZ'):
-    if not _sheet_exists(spreadsheet_id, sheet_name):
+def fetch_colored_cells_from_google(spreadsheet_id, sheet_name, column_count=None, check_exists=True):
+    """
+    Get the values of the header cells that have a background colour, reading only the header row.
+
+    :param spreadsheet_id: ID of the Google Spreadsheet
+    :param sheet_name: Name of the sheet within the spreadsheet
+    :param column_count: Number of columns in use, to read only those; the whole header row by default
+    :param check_exists: Check that the sheet exists first, returning None if it doesn't
+    """
+    if check_exists and not _sheet_exists(spreadsheet_id, sheet_name):
         return None
 
     EXCLUDED_VALUES = ['by the way', 'personalization date']
     service = GoogleService.get_instance().get_service('sheets', 'v4')
 
+    header_range = f"'{sheet_name}'!A1:{_column_number_to_letter(column_count)}1" if column_count \
+        else f"'{sheet_name}'!1:1"
     request = service.spreadsheets().get(
         spreadsheetId=spreadsheet_id,
-        ranges=[f'{sheet_name}'],
+        ranges=[header_range],
         includeGridData=True,
-        fields='sheets.data.rowData.values.userEnteredFormat.backgroundColor,sheets.data.rowData.values.formattedValue'
+        fields='sheets.data.rowData.values(userEnteredFormat.backgroundColor,formattedValue)'
     )
+    throttle('sheets_read')
     response = request.execute()
 
-    colored_cells = []
     colored_cells_values = []
 
-    for row_index, row in enumerate(response['sheets'][0]['data'][0]['rowData']):
-        if row_index != 0:
-            break
-
-        for col_index, cell in enumerate(row.get('values', [])):
-            if 'userEnteredFormat' in cell and 'backgroundColor' in cell['userEnteredFormat']:
-                bg_color = cell['userEnteredFormat']['backgroundColor']
-                # Check if the background color is not white (1, 1, 1)
-                if bg_color != {'red': 1, 'green': 1, 'blue': 1}:
-                    value = cell.get('formattedValue', '')
-                    if value.lower() in EXCLUDED_VALUES or value == '':
-                        continue
-
-                    colored_cells.append({
-                        'row': row_index + 1,
-                        'column': col_index + 1,
-                        'value': value,
-                        'color': bg_color
-                    })
-                    colored_cells_values.append(value)
+    row_data = response['sheets'][0]['data'][0].get('rowData', [])
+    header_row = row_data[0] if row_data else {}
+    for cell in header_row.get('values', []):
+        if 'userEnteredFormat' in cell and 'backgroundColor' in cell['userEnteredFormat']:
+            bg_color = cell['userEnteredFormat']['backgroundColor']
+            # Check if the background color is not white (1, 1, 1)
+            if bg_color != {'red': 1, 'green': 1, 'blue': 1}:
+                value = cell.get('formattedValue', '')
+                if value.lower() in EXCLUDED_VALUES or value == '':
+                    continue
+
+                colored_cells_values.append(value)
 
     return colored_cells_values
 
@@ -61,10 +67,40 @@ def fetch_sheet_data_from_google(spreadsheet_id, sheet_name='New Connections', r
     service = GoogleService.get_instance().get_service('sheets', 'v4')
 
     sheet = service.spreadsheets()
+    throttle('sheets_read')
     result = sheet.values().get(spreadsheetId=spreadsheet_id,
                                 range=f"'{sheet_name}'!{range_name}").execute()
 
-    values = result.get('values', [])
+    return _number_rows(result.get('values', []))
+
+
+def fetch_sheets_data_from_google(spreadsheet_id, sheet_names, range_name='A:ZZ'):
+    """
+    Read several sheets of a spreadsheet in a single request.
+
+    :param spreadsheet_id: ID of the Google Spreadsheet
+    :param sheet_names: Names of sheets that exist in the spreadsheet
+    :param range_name: The range to read from every sheet
+    :return: The rows of each sheet, with row numbers added like `fetch_sheet_data_from_google`, or None for an
+             empty sheet
+    """
+    if not sheet_names:
+        return {}
+
+    service = GoogleService.get_instance().get_service('sheets', 'v4')
+
+    throttle('sheets_read')
+    result = service.spreadsheets().values().batchGet(
+        spreadsheetId=spreadsheet_id, ranges=[f"'{sheet_name}'!{range_name}" for sheet_name in sheet_names]).execute()
+
+    # Value ranges are returned in the order they were requested
+    return {sheet_name: _number_rows(value_range.get('values', []))
+            for sheet_name, value_range in zip(sheet_names, result.get('valueRanges', []))}
+
+
+def _number_rows(values):
+    if not values:
+        return None
 
     # Add row numbers to the data
     numbered_values = [['row_number'] + values[0]]  # Add 'row_number' to headers
@@ -82,26 +118,45 @@ def update_sheet_rows(spreadsheet_id, sheet_name, row_number, updates):
     :param row_number: The row number to update (1-indexed)
     :param updates: A dictionary where keys are column names and values are the new cell values
     """
+    # First, get the header row to map column names to column letters
+    header = fetch_header_row_from_google(spreadsheet_id, sheet_name)
+    return update_sheets_rows(spreadsheet_id, [(sheet_name, row_number, updates)], {sheet_name: header})
+
+
+def fetch_header_row_from_google(spreadsheet_id, sheet_name):
     service = GoogleService.get_instance().get_service('sheets', 'v4')
 
-    # First, get the header row to map column names to column letters
     header_range = f"'{sheet_name}'!1:1"
+    throttle('sheets_read')
     header_result = service.spreadsheets().values().get(
         spreadsheetId=spreadsheet_id, range=header_range).execute()
-    header = header_result.get('values', [[]])[0]
+    return header_result.get('values', [[]])[0]
+
+
+def update_sheets_rows(spreadsheet_id, row_updates, headers):
+    """
+    Update cells in many rows, of one or more sheets of a Google Spreadsheet, with a single request.
+
+    :param spreadsheet_id: ID of the Google Spreadsheet
+    :param row_updates: A (sheet name, row number (1-indexed), {column name: new value}) tuple per row
+    :param headers: The header row of each sheet, to map column names to column letters
+    """
+    service = GoogleService.get_instance().get_service('sheets', 'v4')
 
     # Create a list of updates
     batch_updates = []
-    for column_name, new_value in updates.items():
-        if column_name in header:
-            column_index = header.index(column_name)
-            column_letter = _column_number_to_letter(column_index + 1)
-            cell_range = f"'{sheet_name}'!{column_letter}{row_number}"
-
-            batch_updates.append({
-                'range': cell_range,
-                'values': [[new_value]]
-            })
+    for sheet_name, row_number, updates in row_updates:
+        header = headers.get(sheet_name, [])
+        for column_name, new_value in updates.items():
+            if column_name in header:
+                column_index = header.index(column_name)
+                column_letter = _column_number_to_letter(column_index + 1)
+                cell_range = f"'{sheet_name}'!{column_letter}{row_number}"
+
+                batch_updates.append({
+                    'range': cell_range,
+                    'values': [[new_value]]
+                })
 
     # Execute the batch update
     if batch_updates:
@@ -109,6 +164,7 @@ def update_sheet_rows(spreadsheet_id, sheet_name, row_number, updates):
             'valueInputOption': 'USER_ENTERED',
             'data': batch_updates
         }
+        throttle('sheets_write')
         result = service.spreadsheets().values().batchUpdate(
             spreadsheetId=spreadsheet_id, body=body).execute()
         return result
@@ -120,11 +176,14 @@ def _sheet_exists(spreadsheet_id, sheet_name):
     try:
         service = GoogleService.get_instance().get_service('sheets', 'v4')
 
+        throttle('sheets_read')
         sheet_metadata = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
         sheets = sheet_metadata.get('sheets', '')
         for sheet in sheets:
             if sheet['properties']['title'] == sheet_name:
                 return True
+    except RateLimitExceeded:
+        raise
     except Exception as e:
         return False
 
@@ -0,0 +1,93 @@
+# app/utils/http_client.py
+
+from typing import Dict, Optional
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.utils.rate_governor import throttle
+
+
+class _ThrottledRetry(Retry):
+    """
+    Retry that takes a token from the provider's rate limit before every retry, not just the first attempt.
+    """
+
+    def __init__(self, *args, provider: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.provider = provider
+
+    def new(self, **kwargs) -> '_ThrottledRetry':
+        retry = super().new(**kwargs)
+        retry.provider = self.provider
+        return retry
+
+    def increment(self, *args, **kwargs) -> '_ThrottledRetry':
+        retry = super().increment(*args, **kwargs)
+        if self.provider:
+            throttle(self.provider)
+        return retry
+
+
+class HttpClient:
+    """
+    Shared HTTP session for outgoing calls.
+
+    Connections are pooled and kept alive per host, every request gets a connect and read timeout unless the
+    caller passes its own, and idempotent requests are retried with exponential backoff on 429 and 5xx responses
+    and on connection errors. Once retries run out the last response is returned as usual.
+
+    Requests to a rate limited provider pass its name as `rate_limit`, and then every attempt, retries included,
+    waits for a token from the provider's budget (see RateGovernor).
+    """
+
+    _instance = None
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self):
+        self.session = self._create_session()
+        self._throttled_sessions: Dict[str, requests.Session] = {}
+        self.timeout = (current_app.config['HTTP_CONNECT_TIMEOUT'], current_app.config['HTTP_READ_TIMEOUT'])
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def _create_session(cls, provider: Optional[str] = None) -> requests.Session:
+        retry = _ThrottledRetry(
+            total=current_app.config['HTTP_MAX_RETRIES'],
+            backoff_factor=current_app.config['HTTP_BACKOFF_FACTOR'],
+            status_forcelist=cls.RETRY_STATUSES,
+            allowed_methods=frozenset({'GET', 'HEAD'}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+            provider=provider,
+        )
+        adapter = HTTPAdapter(pool_connections=current_app.config['HTTP_POOL_CONNECTIONS'],
+                              pool_maxsize=current_app.config['HTTP_POOL_MAXSIZE'],
+                              max_retries=retry)
+
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def get(self, url: str, rate_limit: Optional[str] = None, **kwargs) -> requests.Response:
+        """
+        :param rate_limit: Key of the provider's budget in RATE_LIMITS, if the request counts against one
+        :raises RateLimitExceeded: If an attempt couldn't get a token from the provider's budget in time
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if not rate_limit:
+            return self.session.get(url, **kwargs)
+
+        session = self._throttled_sessions.get(rate_limit)
+        if session is None:
+            session = self._throttled_sessions.setdefault(rate_limit, self._create_session(rate_limit))
+        throttle(rate_limit)
+        return session.get(url, **kwargs)
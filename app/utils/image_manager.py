@@ -1,21 +1,67 @@
 # app/utils/image_manager.py
 
+import hashlib
 import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+from uuid import uuid4
+
+import orjson
 import requests
 import logging
-from glob import glob
 from mimetypes import guess_extension
-from werkzeug.utils import secure_filename
 from flask import current_app
-from typing import Optional
+from PIL import Image, UnidentifiedImageError
+
+from app.utils.http_client import HttpClient
 
 
 class ImageManager:
+    """
+    Stores contact images once per distinct content and keeps an index of which file belongs to which contact
+    image.
+
+    Files are named after the SHA-256 of their content, so identical images such as default avatars are stored
+    once and shared. The index from (username, image type) to file is a SQLite table (IMAGE_INDEX_PATH) shared
+    by all workers, and a file's references are the index rows that point at it; a file is deleted when nothing
+    refers to it any more. Changes to the index and the files they imply are made in one write transaction, so
+    workers never delete a file another one has just started to use. Images saved before content addressing
+    (`{username}_{type}.{ext}`) and those of the former JSON manifest are indexed as they are.
+
+    Downloads are streamed to disk in chunks, and each stored image gets a WebP thumbnail sized for the review
+    UI (IMAGE_THUMBNAIL_SIZES), which is what contact cards link to.
+    """
+
     _instance = None
+    CONTENT_DIRECTORY = 'content'
+    MANIFEST_FILENAME = 'index.json'
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS images (
+            username TEXT NOT NULL,
+            image_type TEXT NOT NULL,
+            path TEXT NOT NULL,
+            PRIMARY KEY (username, image_type)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_images_path ON images (path)",
+    )
 
     def __init__(self):
         self.image_storage_path = os.path.join(current_app.static_folder, 'images')
+        self.thumbnail_sizes: Dict[str, Tuple[int, int]] = current_app.config['IMAGE_THUMBNAIL_SIZES']
+        self._download_executor = ThreadPoolExecutor(max_workers=current_app.config['IMAGE_DOWNLOAD_WORKERS'],
+                                                     thread_name_prefix='image-download')
         self._ensure_storage_directory()
+        self.index_path = current_app.config['IMAGE_INDEX_PATH']
+        self._local = threading.local()
+        with self._transaction() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            self._import_unindexed_images(connection)
 
     @classmethod
     def get_instance(cls):
@@ -24,7 +70,25 @@ class ImageManager:
         return cls._instance
 
     def _ensure_storage_directory(self):
-        os.makedirs(self.image_storage_path, exist_ok=True)
+        os.makedirs(os.path.join(self.image_storage_path, self.CONTENT_DIRECTORY), exist_ok=True)
+
+    def get_or_download_images(self, image_urls: Dict[str, Optional[str]], username: str) -> Dict[str, Optional[str]]:
+        """
+        Get or download several images of a contact at the same time.
+
+        :param image_urls: URL of the image to download per image type (e.g., 'profile', 'banner')
+        :param username: Unique identifier for the contact (e.g., LinkedIn username)
+        :return: The URL path to access each saved image (its thumbnail where there is one), or None if failed
+        """
+        app = current_app._get_current_object()
+        futures = {image_type: self._download_executor.submit(self._download_in_app_context, app, image_url,
+                                                              username, image_type)
+                   for image_type, image_url in image_urls.items()}
+        return {image_type: future.result() for image_type, future in futures.items()}
+
+    def _download_in_app_context(self, app, image_url: Optional[str], username: str, image_type: str) -> Optional[str]:
+        with app.app_context():
+            return self.get_or_download_image(image_url, username, image_type)
 
     def get_or_download_image(self, image_url: Optional[str], username: str, image_type: str) -> Optional[str]:
         """
@@ -33,47 +97,117 @@ class ImageManager:
         :param image_url: URL of the image to download
         :param username: Unique identifier for the contact (e.g., LinkedIn username)
         :param image_type: Type of the image (e.g., 'profile', 'banner')
-        :return: The URL path to access the saved image, or None if failed
+        :return: The URL path to access the saved image (its thumbnail where there is one), or None if failed
         """
         if not image_url:
             return None
 
-        existing_image = self.get_image_url(f'{username}_{image_type}')
+        existing_image = self.get_image_url(username, image_type)
         if existing_image:
             return existing_image
 
         # If no existing file, download the image
-        response = requests.get(image_url)
-        if response.status_code == 200:
-            content_type = response.headers.get('Content-Type', '').split(';')[0]
-            ext = guess_extension(content_type)
-
-            if not ext:
-                logging.warning(
-                    f"Couldn't determine file extension for {image_type} image of {username}. Defaulting to .jpg")
-                ext = '.jpg'
-
-            filename = f'{username}_{image_type}{ext}'
-            return self.save_image(response.content, filename)
-        else:
-            logging.error(f"Failed to download {image_type} image for {username}")
+        try:
+            with HttpClient.get_instance().get(image_url, stream=True) as response:
+                if response.status_code != 200:
+                    logging.error(f"Failed to download {image_type} image for {username}")
+                    return None
+
+                content_type = response.headers.get('Content-Type', '').split(';')[0]
+                ext = guess_extension(content_type)
+
+                if not ext:
+                    logging.warning(
+                        f"Couldn't determine file extension for {image_type} image of {username}. Defaulting to .jpg")
+                    ext = '.jpg'
+
+                temporary_path, digest = self._stream_to_temporary_file(response)
+        except (requests.RequestException, OSError) as e:
+            logging.error(f"Failed to download {image_type} image for {username}: {str(e)}")
             return None
 
-    def save_image(self, image_content: bytes, filename: str) -> str:
+        return self._store_file(temporary_path, digest, username, image_type, ext)
+
+    def save_image(self, image_content: bytes, username: str, image_type: str, ext: str) -> str:
         """
-        Save an image file associated with a contact.
+        Save an image associated with a contact, reusing the stored file if the same content already exists.
 
         :param image_content: The binary content of the image
-        :param filename: Filename of the image
-        :return: The URL path to access the saved image
+        :param username: Unique identifier for the contact (e.g., LinkedIn username)
+        :param image_type: Type of the image (e.g., 'profile', 'banner')
+        :param ext: File extension of the image, including the dot
+        :return: The URL path to access the saved image (its thumbnail where there is one)
         """
-        secure_name = secure_filename(filename)
-        file_path = os.path.join(self.image_storage_path, secure_name)
-
-        with open(file_path, 'wb') as f:
+        temporary_path = self._temporary_path()
+        with open(temporary_path, 'wb') as f:
             f.write(image_content)
+        return self._store_file(temporary_path, hashlib.sha256(image_content).hexdigest(), username, image_type, ext)
+
+    def _stream_to_temporary_file(self, response: requests.Response) -> Tuple[str, str]:
+        """
+        Write a streamed response to a temporary file in chunks, hashing it along the way.
+        """
+        sha256 = hashlib.sha256()
+        temporary_path = self._temporary_path()
+        try:
+            with open(temporary_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=self.DOWNLOAD_CHUNK_SIZE):
+                    sha256.update(chunk)
+                    f.write(chunk)
+        except Exception:
+            os.remove(temporary_path)
+            raise
+        return temporary_path, sha256.hexdigest()
+
+    def _store_file(self, temporary_path: str, digest: str, username: str, image_type: str, ext: str) -> str:
+        relative_path = f'{self.CONTENT_DIRECTORY}/{digest}{ext}'
+        file_path = os.path.join(self.image_storage_path, relative_path)
+
+        with self._transaction() as connection:
+            if os.path.exists(file_path):
+                os.remove(temporary_path)
+            else:
+                os.replace(temporary_path, file_path)
+
+            self._set_reference(connection, username, image_type, relative_path)
 
-        return f'/static/images/{secure_name}'
+        thumbnail_path = self._create_thumbnail(relative_path, image_type)
+        return self._url(thumbnail_path or relative_path)
+
+    def _create_thumbnail(self, relative_path: str, image_type: str) -> Optional[str]:
+        """
+        Create the WebP thumbnail of a stored image for its image type, if it doesn't exist yet.
+
+        :return: The path of the thumbnail relative to the image storage, or None if there is none
+        """
+        size = self.thumbnail_sizes.get(image_type)
+        if not size:
+            return None
+
+        thumbnail_path = self._thumbnail_path(relative_path, size)
+        file_path = os.path.join(self.image_storage_path, thumbnail_path)
+        if os.path.exists(file_path):
+            return thumbnail_path
+
+        try:
+            with Image.open(os.path.join(self.image_storage_path, relative_path)) as image:
+                image.thumbnail(size)
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+                image.save(f'{file_path}.tmp', format='WEBP', quality=80)
+            os.replace(f'{file_path}.tmp', file_path)
+            return thumbnail_path
+        except (UnidentifiedImageError, OSError) as e:
+            # Formats Pillow can't read, such as SVG, are served as they are
+            logging.warning(f"Couldn't create thumbnail for {relative_path}: {str(e)}")
+            return None
+
+    def _temporary_path(self) -> str:
+        return os.path.join(self.image_storage_path, self.CONTENT_DIRECTORY, f'{uuid4().hex}.tmp')
+
+    @staticmethod
+    def _thumbnail_path(relative_path: str, size: Tuple[int, int]) -> str:
+        return f'{os.path.splitext(relative_path)[0]}.{size[0]}x{size[1]}.webp'
 
     def delete_images_by_contact(self, username: str):
         """
@@ -81,19 +215,108 @@ class ImageManager:
 
         :param username: Unique identifier for the contact (e.g., LinkedIn username)
         """
-        pattern = os.path.join(self.image_storage_path, f"{username}*")
-        for file_path in glob(pattern):
-            os.remove(file_path)
+        with self._transaction() as connection:
+            image_types = [row[0] for row in connection.execute(
+                "SELECT image_type FROM images WHERE username = ?", (username,)).fetchall()]
+            for image_type in image_types:
+                self._set_reference(connection, username, image_type, None)
 
-    def get_image_url(self, filename_pattern: str) -> Optional[str]:
+    def get_image_url(self, username: str, image_type: str) -> Optional[str]:
         """
-        Get the URL of an image based on a filename pattern.
+        Get the URL of a contact's image, pointing at its thumbnail where there is one.
 
-        :param filename_pattern: Pattern to match the filename
+        :param username: Unique identifier for the contact (e.g., LinkedIn username)
+        :param image_type: Type of the image (e.g., 'profile', 'banner')
         :return: The URL path to access the image, or None if not found
         """
-        pattern = os.path.join(self.image_storage_path, filename_pattern)
-        existing_files = glob(pattern)
-        if existing_files:
-            return f'/static/images/{os.path.basename(existing_files[0])}'
-        return None
+        row = self._connection().execute("SELECT path FROM images WHERE username = ? AND image_type = ?",
+                                         (username, image_type)).fetchone()
+        if not row:
+            return None
+
+        relative_path = row[0]
+
+        size = self.thumbnail_sizes.get(image_type)
+        if size and relative_path.startswith(f'{self.CONTENT_DIRECTORY}/'):
+            thumbnail_path = self._thumbnail_path(relative_path, size)
+            if os.path.exists(os.path.join(self.image_storage_path, thumbnail_path)):
+                return self._url(thumbnail_path)
+        return self._url(relative_path)
+
+    def _set_reference(self, connection: sqlite3.Connection, username: str, image_type: str,
+                       relative_path: Optional[str]):
+        """
+        Point a contact image at a stored file, or at nothing, deleting the file it referred to before if nothing
+        else refers to it. Must be called inside a write transaction.
+        """
+        previous = connection.execute("SELECT path FROM images WHERE username = ? AND image_type = ?",
+                                      (username, image_type)).fetchone()
+        if relative_path:
+            connection.execute("INSERT OR REPLACE INTO images (username, image_type, path) VALUES (?, ?, ?)",
+                               (username, image_type, relative_path))
+        else:
+            connection.execute("DELETE FROM images WHERE username = ? AND image_type = ?", (username, image_type))
+
+        previous_path = previous[0] if previous else None
+        if previous_path and previous_path != relative_path and not connection.execute(
+                "SELECT 1 FROM images WHERE path = ? LIMIT 1", (previous_path,)).fetchone():
+            stored_paths = [previous_path] + [self._thumbnail_path(previous_path, size)
+                                              for size in self.thumbnail_sizes.values()]
+            for stored_path in stored_paths:
+                try:
+                    os.remove(os.path.join(self.image_storage_path, stored_path))
+                except FileNotFoundError:
+                    pass
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Write transaction that holds the database's write lock from the start, which serializes index changes
+        across threads and workers.
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _import_unindexed_images(self, connection: sqlite3.Connection):
+        """
+        Index the images of the former JSON manifest and those saved before content addressing, which are named
+        {username}_{type}.{ext}. Images that are already indexed are left as they are.
+        """
+        manifest_path = os.path.join(self.image_storage_path, self.MANIFEST_FILENAME)
+        entries = []
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'rb') as f:
+                for key, relative_path in orjson.loads(f.read()).items():
+                    username, _, image_type = key.rpartition('_')
+                    entries.append((username, image_type, relative_path))
+
+        manifest_paths = {relative_path for _, _, relative_path in entries}
+        for entry in os.scandir(self.image_storage_path):
+            if not entry.is_file() or entry.name == self.MANIFEST_FILENAME or entry.name in manifest_paths:
+                continue
+            username, _, image_type = os.path.splitext(entry.name)[0].rpartition('_')
+            if username:
+                entries.append((username, image_type, entry.name))
+
+        connection.executemany("INSERT OR IGNORE INTO images (username, image_type, path) VALUES (?, ?, ?)",
+                               entries)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+
+    @staticmethod
+    def _url(relative_path: str) -> str:
+        return f'/static/images/{relative_path}'
@@ -0,0 +1,66 @@
+# app/utils/nubela_cache.py
+
+import gzip
+import hashlib
+import logging
+import os
+import time
+from typing import Optional
+
+from flask import current_app
+
+
+class NubelaProfileCache:
+    """
+    Raw Proxycurl profile responses, stored gzip-compressed on disk per LinkedIn username.
+
+    Profiles survive contacts being deleted from the contact store, so re-processing a person only pays for
+    the API call again once the stored profile is older than NUBELA_CACHE_MAX_AGE.
+    """
+
+    _instance = None
+
+    def __init__(self):
+        self.storage_path = current_app.config['NUBELA_CACHE_PATH']
+        self.max_age = current_app.config['NUBELA_CACHE_MAX_AGE']
+        os.makedirs(self.storage_path, exist_ok=True)
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def get(self, username: str, allow_stale: bool = False) -> Optional[bytes]:
+        """
+        Get the stored raw profile of a user.
+
+        :param username: LinkedIn username of the profile
+        :param allow_stale: Also return profiles older than NUBELA_CACHE_MAX_AGE
+        :return: The raw JSON response, or None if there is no usable profile
+        """
+        file_path = self._file_path(username)
+        try:
+            if not allow_stale and time.time() - os.path.getmtime(file_path) > self.max_age:
+                return None
+            with gzip.open(file_path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError) as e:
+            logging.error(f"Error reading cached Nubela profile for {username}: {str(e)}")
+            return None
+
+    def set(self, username: str, raw_response: bytes):
+        file_path = self._file_path(username)
+        temporary_path = f'{file_path}.tmp'
+        try:
+            with gzip.open(temporary_path, 'wb') as f:
+                f.write(raw_response)
+            os.replace(temporary_path, file_path)
+        except OSError as e:
+            logging.error(f"Error caching Nubela profile for {username}: {str(e)}")
+
+    def _file_path(self, username: str) -> str:
+        # Hashed, since usernames that differ only in characters a file name can't hold must not share a file
+        return os.path.join(self.storage_path, f'{hashlib.sha256(username.encode()).hexdigest()}.json.gz')
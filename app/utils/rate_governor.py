@@ -0,0 +1,96 @@
+# app/utils/rate_governor.py
+
+import logging
+import time
+from typing import Optional
+
+from flask import current_app
+
+from app.utils.redis_cache import RedisCache
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class RateGovernor:
+    """
+    Token buckets per provider, kept in Redis so every worker process draws from the same budget.
+
+    Callers queue for a token until their deadline instead of being rejected by the provider. Budgets are set in
+    RATE_LIMITS as requests per minute plus a burst size. If Redis is unavailable, calls go through unthrottled.
+    """
+
+    _instance = None
+
+    # Refills the bucket for the time elapsed since the last call, then takes the tokens if there are enough.
+    # Returns 0 when the tokens were taken, otherwise how many milliseconds to wait before there will be.
+    TOKEN_BUCKET_SCRIPT = """
+        local rate = tonumber(ARGV[1])
+        local capacity = tonumber(ARGV[2])
+        local requested = tonumber(ARGV[3])
+        local clock = redis.call('TIME')
+        local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(state[1]) or capacity
+        local updated = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + (now - updated) * rate / 1000)
+
+        local wait = 0
+        if tokens >= requested then
+            tokens = tokens - requested
+        else
+            wait = math.ceil((requested - tokens) * 1000 / rate)
+        end
+
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+        redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * 1000 / rate) + 1000)
+        return wait
+    """
+
+    def __init__(self):
+        self.redis = RedisCache.get_instance().redis
+        self.limits = current_app.config['RATE_LIMITS']
+        self.default_timeout = current_app.config['RATE_LIMIT_WAIT_TIMEOUT']
+        self._take_tokens = self.redis.register_script(self.TOKEN_BUCKET_SCRIPT)
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def acquire(self, provider: str, tokens: int = 1, timeout: Optional[float] = None):
+        """
+        Block until the provider's budget allows the call.
+
+        :param provider: Key of the budget in RATE_LIMITS, e.g. 'nubela'
+        :param tokens: Number of requests the call will make
+        :param timeout: Longest to queue in seconds, RATE_LIMIT_WAIT_TIMEOUT by default
+        :raises RateLimitExceeded: If no token became available before the deadline
+        """
+        requests_per_minute, burst = self.limits[provider]
+        rate = requests_per_minute / 60
+        tokens = min(tokens, burst)  # A bucket never holds more than its burst size
+        deadline = time.monotonic() + (timeout if timeout is not None else self.default_timeout)
+
+        while True:
+            try:
+                wait_ms = self._take_tokens(keys=[f"rate_limit:{provider}"], args=[rate, burst, tokens])
+            except Exception as e:
+                logging.error(f"Error checking the {provider} rate limit, continuing unthrottled: {str(e)}")
+                return
+
+            if wait_ms == 0:
+                return
+
+            remaining = deadline - time.monotonic()
+            if wait_ms / 1000 > remaining:
+                logging.warning(f"Rate limit for {provider} not available within the deadline")
+                raise RateLimitExceeded(f"No {provider} capacity available within the deadline")
+            time.sleep(wait_ms / 1000)
+
+
+def throttle(provider: str, tokens: int = 1):
+    RateGovernor.get_instance().acquire(provider, tokens)
@@ -1,13 +1,37 @@
 import logging
-from typing import Any
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Dict, NamedTuple
+from uuid import uuid4
 
 import redis
+from cachetools import TLRUCache
 from flask import current_app
 from orjson import orjson
+from redis.lock import Lock
+
+
+class _LocalEntry(NamedTuple):
+    value: Any
+    size: int
+    ttl: float
 
 
 class RedisCache:
+    """
+    Redis-backed cache with a bounded in-process layer of already decoded values in front of it.
+
+    Every set and delete is announced on a pub/sub channel so that other workers drop their local copies.
+    Values returned by `get` may be shared between callers and must be treated as read-only.
+
+    Each change of a key bumps its generation, and a value read from Redis is only kept locally if its key's
+    generation didn't change during the read, so that a concurrent set or delete can't be undone by a slower read.
+    """
+
     _instance = None
+    INVALIDATION_CHANNEL = 'cache_invalidation'
+    MAX_TRACKED_GENERATIONS = 100000  # Past this, generations are forgotten, failing the reads in progress
 
     def __init__(self):
         self.redis = redis.Redis(
@@ -15,6 +39,18 @@ class RedisCache:
             port=current_app.config['REDIS_PORT'],
             db=current_app.config['REDIS_DB']
         )
+        self.instance_id = uuid4().hex
+        self.local_ttl = current_app.config['LOCAL_CACHE_TTL']
+        self._local = TLRUCache(maxsize=current_app.config['LOCAL_CACHE_MAX_BYTES'],
+                                ttu=lambda key, entry, now: now + entry.ttl,
+                                getsizeof=lambda entry: entry.size)
+        self._local_lock = threading.Lock()
+        # The generation of a key is the number of the last change to it, or of the last time generations were
+        # forgotten if it hasn't changed since
+        self._change_count = 0
+        self._generations: Dict[str, int] = {}
+        self._forgotten_generations = 0
+        self._local_enabled = self._subscribe_to_invalidations()
 
     @classmethod
     def get_instance(cls):
@@ -25,22 +61,214 @@ class RedisCache:
     def set(self, key: str, value: Any, expire: int = 10800) -> bool:
         try:
             serialized_value = orjson.dumps(value)
-            return self.redis.set(key, serialized_value, ex=expire)
+            result = self.redis.set(key, serialized_value, ex=expire)
         except Exception as e:
             logging.error(f"Error serializing or setting Redis cache: {str(e)}")
             return False
 
+        self._publish_invalidation(key)
+        self._drop_local(key)
+        self._store_local(key, value, len(serialized_value), min(self.local_ttl, self._seconds(expire)))
+        return result
+
     def get(self, key: str) -> Any | None:
+        with self._local_lock:
+            entry = self._local.get(key)
+        if entry is not None:
+            return entry.value
+
         try:
-            value = self.redis.get(key)
+            generation = self._current_generation()
+            value, ttl_ms = self.redis.pipeline(transaction=False).get(key).pttl(key).execute()
             if value:
-                return orjson.loads(value)
+                decoded_value = orjson.loads(value)
+                self._store_local(key, decoded_value, len(value), self._local_ttl(ttl_ms), read_at=generation)
+                return decoded_value
         except Exception as e:
             logging.error(f"Error retrieving or deserializing Redis cache: {str(e)}")
         return None
 
     def delete(self, key: str):
+        # Dropped after Redis, so that a concurrent get can't bring the deleted value back into the local layer
         self.redis.delete(key)
+        self._drop_local(key)
+        self._publish_invalidation(key)
+
+    def hset_many(self, key: str, mapping: Dict[Any, Any], expire: int = 10800, replace: bool = False) -> bool:
+        """
+        Set several fields of a hash at once.
+
+        :param replace: Replace the whole hash, atomically, instead of adding to it
+        """
+        serialized_mapping = {str(field): orjson.dumps(value) for field, value in mapping.items()}
+        try:
+            pipeline = self.redis.pipeline(transaction=True)
+            if replace:
+                pipeline.delete(key)
+            if serialized_mapping:
+                pipeline.hset(key, mapping=serialized_mapping)
+                pipeline.expire(key, expire)
+            pipeline.execute()
+        except Exception as e:
+            logging.error(f"Error serializing or setting Redis hash: {str(e)}")
+            return False
+
+        self._publish_invalidation(key)
+        self._drop_local(key)
+        if replace:
+            self._store_local(key, {str(field): value for field, value in mapping.items()},
+                              sum(len(value) for value in serialized_mapping.values()),
+                              min(self.local_ttl, self._seconds(expire)))
+        return True
+
+    def hmerge(self, key: str, field: Any, updates: Dict[str, Any]) -> Dict[str, Any] | None:
+        """
+        Merge `updates` into the dict stored in one field of a hash, atomically, so that concurrent merges into
+        the same field don't lose each other's keys. Nothing is written if the field doesn't exist, which also
+        means an expired hash is never recreated without an expiry.
+
+        :return: The merged dict, or None if there was nothing to merge into
+        """
+        field = str(field)
+
+        def merge(pipeline) -> Dict[str, Any] | None:
+            current = pipeline.hget(key, field)
+            if current is None:
+                return None
+            merged = {**orjson.loads(current), **updates}
+            pipeline.multi()
+            pipeline.hset(key, field, orjson.dumps(merged))
+            return merged
+
+        try:
+            merged = self.redis.transaction(merge, key, value_from_callable=True)
+        except Exception as e:
+            logging.error(f"Error merging into Redis hash field: {str(e)}")
+            return None
+        if merged is None:
+            return None
+
+        self._publish_invalidation(key)
+        with self._local_lock:
+            entry = self._local.get(key)
+        self._drop_local(key)
+        if entry is not None:
+            # Cached values are shared with callers, so the local copy is replaced rather than changed
+            self._store_local(key, {**entry.value, field: merged}, entry.size, entry.ttl)
+        return merged
+
+    def hget(self, key: str, field: Any) -> Any | None:
+        with self._local_lock:
+            entry = self._local.get(key)
+        if entry is not None:
+            return entry.value.get(str(field))
+
+        try:
+            value = self.redis.hget(key, str(field))
+            if value:
+                return orjson.loads(value)
+        except Exception as e:
+            logging.error(f"Error retrieving or deserializing Redis hash field: {str(e)}")
+        return None
+
+    def hgetall(self, key: str) -> Dict[str, Any]:
+        with self._local_lock:
+            entry = self._local.get(key)
+        if entry is not None:
+            return entry.value
+
+        try:
+            generation = self._current_generation()
+            values, ttl_ms = self.redis.pipeline(transaction=False).hgetall(key).pttl(key).execute()
+            if values:
+                decoded_values = {field.decode('utf-8'): orjson.loads(value) for field, value in values.items()}
+                self._store_local(key, decoded_values, sum(len(value) for value in values.values()),
+                                  self._local_ttl(ttl_ms), read_at=generation)
+                return decoded_values
+        except Exception as e:
+            logging.error(f"Error retrieving or deserializing Redis hash: {str(e)}")
+        return {}
+
+    def lock(self, key: str, timeout: float, blocking_timeout: float) -> Lock:
+        """
+        Short-lived lock shared by all workers, released automatically after `timeout` seconds.
+        """
+        return self.redis.lock(f"lock:{key}", timeout=timeout, blocking_timeout=blocking_timeout)
+
+    def _store_local(self, key: str, value: Any, size: int, ttl: float, read_at: int = None):
+        """
+        :param read_at: For values read from Redis, the generation before the read. The value isn't kept if the
+            key has changed since.
+        """
+        if not self._local_enabled or size > self._local.maxsize:
+            return
+        with self._local_lock:
+            if read_at is not None and self._generations.get(key, self._forgotten_generations) > read_at:
+                return
+            self._local[key] = _LocalEntry(value, size, ttl)
+
+    def _drop_local(self, key: str):
+        """
+        Drop the local copy of a key that has changed, after the change is made in Redis.
+        """
+        with self._local_lock:
+            self._local.pop(key, None)
+            self._change_count += 1
+            if len(self._generations) >= self.MAX_TRACKED_GENERATIONS:
+                self._generations.clear()
+                self._forgotten_generations = self._change_count
+            self._generations[key] = self._change_count
+
+    def _current_generation(self) -> int:
+        with self._local_lock:
+            return self._change_count
+
+    def _publish_invalidation(self, key: str):
+        try:
+            self.redis.publish(self.INVALIDATION_CHANNEL, f"{self.instance_id}:{key}")
+        except Exception as e:
+            logging.error(f"Error publishing cache invalidation for {key}: {str(e)}")
+
+    def _subscribe_to_invalidations(self) -> bool:
+        """
+        Listen for invalidations from other workers. Without the subscription local copies could go stale,
+        so the in-process layer stays disabled if it cannot be set up.
+        """
+        try:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.INVALIDATION_CHANNEL: self._handle_invalidation})
+            pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=self._handle_subscription_error)
+            return True
+        except Exception as e:
+            logging.error(f"Error subscribing to cache invalidations, local cache disabled: {str(e)}")
+            return False
+
+    def _handle_invalidation(self, message: dict):
+        sender, _, key = message['data'].decode('utf-8').partition(':')
+        if sender != self.instance_id:
+            self._drop_local(key)
+
+    def _handle_subscription_error(self, error: Exception, pubsub, thread):
+        # Invalidations may have been missed while the connection was down
+        logging.error(f"Error receiving cache invalidations: {str(error)}")
+        with self._local_lock:
+            self._local.clear()
+            self._change_count += 1
+            self._generations.clear()
+            self._forgotten_generations = self._change_count
+        time.sleep(1)
+
+    def _local_ttl(self, ttl_ms: int) -> float:
+        """
+        How long to keep a local copy of a key with `ttl_ms` left in Redis (as returned by PTTL), so that it
+        never outlives the key.
+        """
+        return min(self.local_ttl, ttl_ms / 1000) if ttl_ms >= 0 else self.local_ttl
+
+    def _seconds(self, expire) -> float:
+        if expire is None:
+            return self.local_ttl
+        return expire.total_seconds() if isinstance(expire, timedelta) else expire
 
 
 def get_redis_cache():
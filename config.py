@@ -13,5 +13,52 @@ class Config:
     REDIS_HOST = os.environ.get('REDIS_HOST') or 'localhost'
     REDIS_PORT = int(os.environ.get('REDIS_PORT') or 6379)
     REDIS_DB = int(os.environ.get('REDIS_DB') or 0)
+    LOCAL_CACHE_MAX_BYTES = int(os.environ.get('LOCAL_CACHE_MAX_BYTES') or 64 * 1024 * 1024)
+    LOCAL_CACHE_TTL = int(os.environ.get('LOCAL_CACHE_TTL') or 300)
+
+    HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS') or 10)
+    HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE') or 20)
+    HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT') or 5)
+    HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT') or 30)
+    HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES') or 3)
+    HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR') or 0.5)
+
+    # Requests per minute and burst size per provider, shared by all workers
+    RATE_LIMITS = {
+        'apify': (30, 5),
+        'nubela': (300, 20),
+        'sheets_read': (60, 10),
+        'sheets_write': (60, 10),
+    }
+    RATE_LIMIT_WAIT_TIMEOUT = float(os.environ.get('RATE_LIMIT_WAIT_TIMEOUT') or 60)
+
+    IMAGE_DOWNLOAD_WORKERS = int(os.environ.get('IMAGE_DOWNLOAD_WORKERS') or 4)
+    # Which stored file belongs to which contact image, shared by all workers
+    IMAGE_INDEX_PATH = os.environ.get('IMAGE_INDEX_PATH') or 'images.db'
+    # Bounding boxes of the WebP thumbnails shown in the review UI, per image type
+    IMAGE_THUMBNAIL_SIZES = {
+        'profile': (256, 256),
+        'banner': (800, 200),
+    }
 
     TINYDB_PATH = 'db.json'
+    SQLITE_PATH = os.environ.get('SQLITE_PATH') or 'contacts.db'
+    CONTACT_STORE_BACKEND = os.environ.get('CONTACT_STORE_BACKEND') or 'sqlite'
+
+    ENRICHMENT_MAX_WORKERS = int(os.environ.get('ENRICHMENT_MAX_WORKERS') or 8)
+    ENRICHMENT_STAGE_TIMEOUT = float(os.environ.get('ENRICHMENT_STAGE_TIMEOUT') or 120)
+    PREFETCH_DEPTH = int(os.environ.get('PREFETCH_DEPTH') or 10)
+    CONTACT_DETAILS_MAX_AGE = int(os.environ.get('CONTACT_DETAILS_MAX_AGE') or 300)
+    STREAM_REPLAY_BUFFER_SIZE = int(os.environ.get('STREAM_REPLAY_BUFFER_SIZE') or 200)
+    STREAM_SESSION_TTL = int(os.environ.get('STREAM_SESSION_TTL') or 6 * 60 * 60)
+    WRITE_BEHIND_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL') or 0.3)
+    WRITE_BEHIND_POLL_INTERVAL = float(os.environ.get('WRITE_BEHIND_POLL_INTERVAL') or 5)
+    WRITE_BEHIND_MAX_BACKOFF = float(os.environ.get('WRITE_BEHIND_MAX_BACKOFF') or 300)
+    SHEET_HEADER_CACHE_TTL = int(os.environ.get('SHEET_HEADER_CACHE_TTL') or 60 * 60)
+    # How often the Drive folder is listed to find edited spreadsheets, in seconds; 0 turns polling off. One worker
+    # lists it per interval: the one that takes a lock that expires after 90% of the interval. Known versions are
+    # kept for three intervals (at least 10 minutes), after which spreadsheets fall back to hourly reloads.
+    DRIVE_POLL_INTERVAL = float(os.environ.get('DRIVE_POLL_INTERVAL') or 60)
+    COMPANY_CACHE_TTL = int(os.environ.get('COMPANY_CACHE_TTL') or 30 * 24 * 60 * 60)
+    NUBELA_CACHE_PATH = os.environ.get('NUBELA_CACHE_PATH') or os.path.join('file_storage', 'nubela')
+    NUBELA_CACHE_MAX_AGE = int(os.environ.get('NUBELA_CACHE_MAX_AGE') or 90 * 24 * 60 * 60)
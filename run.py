@@ -1,4 +1,9 @@
 from app import app
+from app.services.sheet_write_queue import SheetWriteQueue
+
+# Start writing the updates queued by earlier runs and other workers without waiting for a first save
+with app.app_context():
+    SheetWriteQueue.get_instance()
 
 if __name__ == '__main__':
     app.run(debug=True)
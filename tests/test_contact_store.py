@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+from tinydb import TinyDB
+
+from app.models import ContactData, CompanyData
+from app.services.contact_store import SQLiteContactStore
+
+
+def _contact(username: str, row_number: int, spreadsheet_id: str = 'sheet') -> ContactData:
+    return ContactData(spreadsheet_id=spreadsheet_id, row_number=row_number, contact_first_name='Jane',
+                       contact_last_name='Doe', contact_job_title='CEO', contact_company_name='Acme', hook_name='',
+                       parsed_name='Jane Doe', company=CompanyData(name='Acme'),
+                       contact_profile_link=f'https://linkedin.com/in/{username}/', linkedin_username=username)
+
+
+class TestSQLiteContactStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.sqlite_path = os.path.join(self.directory.name, 'contacts.db')
+        self.tinydb_path = os.path.join(self.directory.name, 'db.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_save_get_and_delete(self):
+        store = SQLiteContactStore(self.sqlite_path)
+        store.save(_contact('jane', 3))
+        store.save(_contact('jane', 4))
+
+        self.assertEqual(store.get('jane').row_number, 4)
+        self.assertEqual(store.get_by_row('sheet', 4).linkedin_username, 'jane')
+        self.assertIsNone(store.get_by_row('sheet', 3))
+        self.assertTrue(store.delete('jane'))
+        self.assertFalse(store.delete('jane'))
+        self.assertIsNone(store.get('jane'))
+
+    def test_list_by_spreadsheet_is_ordered_by_row(self):
+        store = SQLiteContactStore(self.sqlite_path)
+        store.save(_contact('b', 2))
+        store.save(_contact('a', 1))
+        store.save(_contact('c', 1, spreadsheet_id='other'))
+
+        self.assertEqual([contact.linkedin_username for contact in store.list_by_spreadsheet('sheet')], ['a', 'b'])
+
+    def test_migrates_tinydb_contacts_once(self):
+        tinydb = TinyDB(self.tinydb_path)
+        tinydb.table('contacts').insert(_contact('jane', 1).model_dump(mode='json'))
+        tinydb.close()
+
+        store = SQLiteContactStore(self.sqlite_path, tinydb_path=self.tinydb_path)
+        self.assertEqual(store.get('jane').row_number, 1)
+
+        store.delete('jane')
+        reopened = SQLiteContactStore(self.sqlite_path, tinydb_path=self.tinydb_path)
+        self.assertIsNone(reopened.get('jane'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app
+from app.models import ContactData, CompanyData
+from app.services.enrichment_pipeline import EnrichmentPipeline, EnrichmentStage
+
+
+def _contact() -> ContactData:
+    return ContactData(spreadsheet_id='sheet', row_number=1, contact_first_name='Jane', contact_last_name='Doe',
+                       contact_job_title='CEO', contact_company_name='Acme', hook_name='', parsed_name='Jane Doe',
+                       company=CompanyData(name='Acme'), contact_profile_link='https://linkedin.com/in/jane/',
+                       linkedin_username='jane')
+
+
+class TestEnrichmentPipeline(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.context = app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        self.context.pop()
+        self.executor.shutdown(wait=True)
+
+    def test_independent_stages_run_concurrently(self):
+        barrier = threading.Barrier(3, timeout=2)
+        stages = [EnrichmentStage(name, lambda contact: barrier.wait()) for name in ('a', 'b', 'c')]
+
+        results = EnrichmentPipeline(stages, self.executor).run(_contact())
+
+        self.assertEqual(results, {'a': True, 'b': True, 'c': True})
+
+    def test_dependent_stage_runs_after_its_dependency(self):
+        order = []
+        stages = [
+            EnrichmentStage('child', lambda contact: order.append('child'), depends_on=['parent']),
+            EnrichmentStage('parent', lambda contact: (time.sleep(0.05), order.append('parent'))),
+        ]
+
+        EnrichmentPipeline(stages, self.executor).run(_contact())
+
+        self.assertEqual(order, ['parent', 'child'])
+
+    def test_failed_or_timed_out_stage_skips_dependents(self):
+        def fail(contact):
+            raise RuntimeError('boom')
+
+        stages = [
+            EnrichmentStage('failing', fail),
+            EnrichmentStage('slow', lambda contact: time.sleep(0.5), timeout=0.05),
+            EnrichmentStage('after_failing', lambda contact: None, depends_on=['failing']),
+            EnrichmentStage('after_slow', lambda contact: None, depends_on=['slow']),
+        ]
+
+        results = EnrichmentPipeline(stages, self.executor).run(_contact())
+
+        self.assertEqual(results, {'failing': False, 'slow': False, 'after_failing': False, 'after_slow': False})
+
+    def test_shared_dependency_runs_once_for_all_contacts(self):
+        searches = []
+        shared_search = self.executor.submit(lambda: searches.append('search') or {'jane': 'result'})
+        seen = []
+        stages = [EnrichmentStage('links', lambda contact: seen.append(shared_search.result()['jane']),
+                                  depends_on=['search'])]
+
+        results = EnrichmentPipeline(stages, self.executor, shared=['search']).run_many(
+            [_contact(), _contact()], shared={'search': shared_search})
+
+        self.assertEqual(results, [{'links': True}, {'links': True}])
+        self.assertEqual(searches, ['search'])
+        self.assertEqual(seen, ['result', 'result'])
+
+    def test_stage_changes_are_applied_and_late_writes_ignored(self):
+        def slow(contact):
+            time.sleep(0.2)
+            contact.bio = 'late'
+
+        def set_headline(contact):
+            contact.headline = 'Founder'
+
+        contact = _contact()
+        stages = [EnrichmentStage('headline', set_headline), EnrichmentStage('slow', slow, timeout=0.05)]
+
+        results = EnrichmentPipeline(stages, self.executor).run(contact)
+        time.sleep(0.3)
+
+        self.assertEqual(results, {'headline': True, 'slow': False})
+        self.assertEqual(contact.headline, 'Founder')
+        self.assertIsNone(contact.bio)
+
+    def test_dependency_cycle_is_rejected(self):
+        stages = [
+            EnrichmentStage('a', lambda contact: None, depends_on=['b']),
+            EnrichmentStage('b', lambda contact: None, depends_on=['a']),
+            EnrichmentStage('c', lambda contact: None),
+        ]
+        with self.assertRaises(ValueError):
+            EnrichmentPipeline(stages, self.executor)
+
+    def test_unknown_dependency_is_rejected(self):
+        with self.assertRaises(ValueError):
+            EnrichmentPipeline([EnrichmentStage('a', lambda contact: None, depends_on=['missing'])], self.executor)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from datetime import datetime
+
+from app.models import PqKeywords
+from app.models.nubela_response_models import Date, Experience
+from app.services.experience_scoring import ContactExperiences, score_experiences
+
+NOW = datetime(2024, 6, 1)
+KEYWORDS = PqKeywords(titles=['Head of'], seniority=['Director'], negative_keywords=['Assistant'])
+
+
+def _experience(title: str, company: str, start: Date, end: Date = None) -> Experience:
+    return Experience(title=title, company=company, starts_at=start, ends_at=end)
+
+
+class TestScoreExperiences(unittest.TestCase):
+    def test_recent_current_role_and_long_tenure_are_relevant(self):
+        new_role = _experience('Head of Sales', 'Globex', Date(year=2024, month=3))
+        long_tenure = _experience('Sales Director', 'Acme', Date(year=2005), Date(year=2023, month=12))
+        short_tenure = _experience('Sales Director', 'Acme', Date(year=2020), Date(year=2023))
+        undated = _experience('Head of Marketing', 'Acme', Date())
+
+        result, = score_experiences([ContactExperiences([long_tenure, short_tenure, undated, new_role],
+                                                        'Head of Sales', 'ACME')], KEYWORDS, now=NOW)
+
+        self.assertEqual(result.experiences, [new_role, long_tenure])
+        self.assertEqual(result.most_likely_current_title, 'Head of Sales')
+        self.assertFalse(result.title_mismatch)
+
+    def test_contacts_are_scored_independently(self):
+        old_role = _experience('Head of Sales', 'Globex', Date(year=2020))
+        assistant = _experience('Assistant Director', 'Initech', Date(year=2024, month=5))
+
+        first, second, third = score_experiences([
+            ContactExperiences([old_role], 'CEO', 'Acme'),
+            ContactExperiences([assistant], 'Assistant Director', 'Initech'),
+            ContactExperiences([], 'CEO', 'Acme'),
+        ], KEYWORDS, now=NOW)
+
+        self.assertEqual(first.experiences, [])
+        self.assertTrue(first.title_mismatch)
+        self.assertEqual(first.most_likely_current_title, 'Head of Sales')
+        self.assertEqual(second.experiences, [])
+        self.assertEqual(third.most_likely_current_title, 'CEO')
+
+    def test_current_role_without_title_keeps_sheet_title(self):
+        untitled = _experience(None, 'Acme', Date(year=2024, month=5))
+        long_tenure = _experience('Sales Director', 'Acme', Date(year=2005))
+
+        result, = score_experiences([ContactExperiences([untitled, long_tenure], 'CEO', 'Acme')], KEYWORDS,
+                                    now=NOW)
+
+        self.assertEqual(result.experiences, [long_tenure])
+        self.assertEqual(result.most_likely_current_title, 'CEO')
+        self.assertFalse(result.title_mismatch)
+
+
+if __name__ == '__main__':
+    unittest.main()
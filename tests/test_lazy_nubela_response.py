@@ -0,0 +1,35 @@
+import unittest
+
+import orjson
+
+from app.models.nubela_response_models import Experience, LazyNubelaResponse, NubelaResponse
+
+RAW_PROFILE = orjson.dumps({
+    'public_identifier': 'jane-doe',
+    'headline': 'CEO at Acme',
+    'experiences': [{'title': 'CEO', 'company': 'Acme', 'starts_at': {'year': 2020, 'month': 3}}],
+    'people_also_viewed': [{'name': 'John Doe', 'link': 'https://linkedin.com/in/john-doe'}],
+})
+
+
+class TestLazyNubelaResponse(unittest.TestCase):
+    def test_fields_are_validated_on_access(self):
+        profile = LazyNubelaResponse(RAW_PROFILE)
+
+        self.assertEqual(profile.headline, 'CEO at Acme')
+        self.assertIsInstance(profile.experiences[0], Experience)
+        self.assertIsNone(profile.summary)
+        self.assertNotIn('people_also_viewed', profile._values)
+        with self.assertRaises(AttributeError):
+            _ = profile.not_a_field
+
+    def test_round_trips_to_the_full_model(self):
+        profile = LazyNubelaResponse(RAW_PROFILE)
+        _ = profile.experiences
+
+        self.assertEqual(profile.to_model(), NubelaResponse.model_validate_json(RAW_PROFILE))
+        self.assertEqual(LazyNubelaResponse(orjson.dumps(profile.to_dict())).to_model(), profile.to_model())
+
+
+if __name__ == '__main__':
+    unittest.main()
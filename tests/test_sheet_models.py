@@ -0,0 +1,47 @@
+import unittest
+
+from app.models.sheet_models import SheetData, PqKeywords
+
+
+class TestSheetDataIndexes(unittest.TestCase):
+    def setUp(self):
+        self.sheet_data = SheetData.from_list([
+            ['Name', 'Company'],
+            ['Jane', 'Acme '],
+            ['John', 'acme'],
+            ['Joan', 'Globex'],
+        ])
+
+    def test_get_row_by_number(self):
+        self.assertEqual(self.sheet_data.get_row(2).get('Name'), 'John')
+        self.assertIsNone(self.sheet_data.get_row(99))
+
+    def test_get_row_by_text_returns_first_match(self):
+        self.assertEqual(self.sheet_data.get_row_by_text(' ACME').get('Name'), 'Jane')
+        self.assertIsNone(self.sheet_data.get_row_by_text('Initech'))
+
+    def test_update_row_keeps_text_index_consistent(self):
+        self.assertEqual(self.sheet_data.get_row_by_text('acme').row_number, 1)
+        self.sheet_data.update_row(1, {'Company': 'Initech'})
+        self.assertEqual(self.sheet_data.get_row_by_text('acme').row_number, 2)
+        self.assertEqual(self.sheet_data.get_row_by_text('initech').row_number, 1)
+
+
+class TestKeywordMatcher(unittest.TestCase):
+    def test_matches_titles_and_seniority_but_not_negative_keywords(self):
+        matcher = PqKeywords(titles=['Head of', 'VP Sales'], seniority=['Director'],
+                             negative_keywords=['Assistant']).get_matcher()
+        self.assertTrue(matcher.matches('Head of Marketing'))
+        self.assertTrue(matcher.matches('vp sales EMEA'))
+        self.assertTrue(matcher.matches('Sales Director'))
+        self.assertFalse(matcher.matches('Assistant to the Director'))
+        self.assertFalse(matcher.matches('Engineer'))
+
+    def test_keywords_are_matched_literally(self):
+        matcher = PqKeywords(titles=['C++'], seniority=[], negative_keywords=[]).get_matcher()
+        self.assertTrue(matcher.matches('c++ developer'))
+        self.assertFalse(matcher.matches('C developer'))
+
+
+if __name__ == '__main__':
+    unittest.main()